@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import Counter
+from hashlib import sha256
+
+from core.cache import INVALIDATED, LRUCache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+# Поля пользователя, которые нужны аутентификации и правам доступа.
+# Только они попадают в кэш; хэш пароля и остальные поля отложены
+# и при обращении читаются из базы.
+TOKEN_USER_FIELDS = ('id', 'is_active', 'is_superuser', 'access_level')
+
+
+class TokenCache:
+    """
+    Токены вместе с пользователями в двух уровнях: LRU воркера
+    с коротким TTL и общий кэш Django.
+
+    invalidate() чистит общий кэш и LRU своего воркера, LRU остальных
+    воркеров устаревает через AUTH_TOKEN_CACHE_LOCAL_TTL секунд.
+    Одновременные промахи по одному токену в потоках воркера ждут
+    одной загрузки. Счётчики попаданий ведутся на воркер.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(
+            settings.AUTH_TOKEN_CACHE_LOCAL_SIZE,
+            ttl=settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+        )
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth:token:{sha256(key.encode()).hexdigest()}'
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key, loader):
+        name = self.cache_key(key)
+        token = self.local.get(name)
+        if token is not None:
+            self.count('local_hits')
+            return token
+        with self._lock:
+            loading = self._loading.get(name)
+            if loading is None:
+                loading = self._loading[name] = threading.Event()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            loading.wait()
+            token = self.local.get(name)
+            if token is not None:
+                self.count('coalesced')
+                return token
+        try:
+            return self.load(name, key, loader)
+        finally:
+            if leader:
+                with self._lock:
+                    del self._loading[name]
+                loading.set()
+
+    def load(self, name, key, loader):
+        token = cache.get(name)
+        if token is not None and token != INVALIDATED:
+            self.count('shared_hits')
+        else:
+            self.count('misses')
+            token = loader(key)
+            cache.add(
+                name,
+                token,
+                timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT,
+            )
+        self.local.set(name, token)
+        return token
+
+    def invalidate(self, key):
+        name = self.cache_key(key)
+        self.local.delete(name)
+        cache.set(
+            name,
+            INVALIDATED,
+            timeout=settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+        )
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        hits = sum(
+            counters.get(name, 0)
+            for name in ('local_hits', 'shared_hits', 'coalesced')
+        )
+        total = hits + counters.get('misses', 0)
+        return {
+            'pid': os.getpid(),
+            'local_hits': counters.get('local_hits', 0),
+            'shared_hits': counters.get('shared_hits', 0),
+            'coalesced': counters.get('coalesced', 0),
+            'misses': counters.get('misses', 0),
+            'hit_rate': hits / total if total else None,
+        }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который берёт токен и пользователя из
+    token_cache: в устойчивом режиме запрос не стоит ни одного
+    обращения к базе на аутентификацию.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key, self.load_token)
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
+
+    def load_token(self, key):
+        model = self.get_model()
+        try:
+            return model.objects.select_related('user').only(
+                'key',
+                'user',
+                *(f'user__{field}' for field in TOKEN_USER_FIELDS),
+            ).get(key=key)
+        except model.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
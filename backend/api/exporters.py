@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+from functools import wraps
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+SHOPPING_LIST_TITLE = 'Список покупок'
+CHUNK_SIZE = 8192
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+def buffered(export):
+    """
+    Склеивает строки выгрузки в куски по CHUNK_SIZE символов,
+    чтобы не отдавать клиенту по строке на каждую позицию.
+    """
+    @wraps(export)
+    def wrapper(rows):
+        buffer, length = [], 0
+        for part in export(rows):
+            buffer.append(part)
+            length += len(part)
+            if length >= CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    return wrapper
+
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer: возвращает строку вместо записи.
+    """
+
+    def write(self, value):
+        return value
+
+
+@buffered
+def export_txt(rows):
+    yield f'{SHOPPING_LIST_TITLE}: \n\n'
+    for name, measurement_unit, amount in rows:
+        yield f'{name} ({measurement_unit}) - {amount}\n'
+
+
+@buffered
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+@buffered
+def export_json(rows):
+    yield '['
+    separator = ''
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            },
+            ensure_ascii=False,
+        )
+        separator = ', '
+    yield ']'
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT),
+        )
+    return PDF_FONT_NAME
+
+
+def export_pdf(rows):
+    """
+    PDF собирается целиком в памяти: reportlab пишет документ
+    только при сохранении, поэтому здесь поток отдаёт один кусок.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    _, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pdf.drawString(PDF_MARGIN, y, f'{SHOPPING_LIST_TITLE}:')
+    y -= 2 * PDF_LINE_HEIGHT
+    for name, measurement_unit, amount in rows:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(
+            PDF_MARGIN, y, f'{name} ({measurement_unit}) - {amount}',
+        )
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', export_txt),
+    'csv': ('text/csv; charset=utf-8', export_csv),
+    'json': ('application/json', export_json),
+    'pdf': ('application/pdf', export_pdf),
+}
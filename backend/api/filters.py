@@ -1,37 +1,98 @@
 from django_filters.rest_framework import (
-    BooleanFilter, FilterSet, ModelMultipleChoiceFilter
+    BooleanFilter, CharFilter, ChoiceFilter, FilterSet, MultipleChoiceFilter
 )
-from recipes.models import Recipe, Tag
-from rest_framework.filters import SearchFilter
+from recipes.cache import tag_ids_by_slug, tags_cache
+from recipes.models import Recipe
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+RECIPE_SEARCH_PARAM = 'search'
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+TAGS_MATCH_CHOICES = (
+    (TAGS_MATCH_ANY, 'Любой из тегов'),
+    (TAGS_MATCH_ALL, 'Все теги'),
+)
+
+
+def tag_choices():
+    return [(tag['slug'], tag['name']) for tag in tags_cache.get()]
 
 
 class RecipesFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
+    tags = MultipleChoiceFilter(choices=tag_choices, method='get_tags')
+    tags_match = ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES,
+        method='get_tags_match',
     )
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'tags_match',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+        )
+
+    def get_tags(self, queryset, name, value):
+        tag_ids = tag_ids_by_slug()
+        return queryset.with_tags(
+            [tag_ids[slug] for slug in value if slug in tag_ids],
+            match_all=(
+                self.form.cleaned_data.get('tags_match') == TAGS_MATCH_ALL
+            ),
+        )
+
+    def get_tags_match(self, queryset, name, value):
+        # Режим только уточняет фильтр tags и учитывается в get_tags.
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorite_recipe__user=user)
+            return queryset.favorited_by(user)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(recipe_in_shopping_cart__user=user)
+            return queryset.in_shopping_cart_of(user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
+
 
 class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    Кроме полей из ordering_fields понимает именованные сортировки
+    ?ordering=popular|favorites|cooking_time|newest. Каждая заканчивается
+    на id, чтобы страницы не перемешивались при равных значениях,
+    и совпадает с индексом рецептов. При поиске без явной сортировки
+    рецепты идут по релевантности.
+    """
+    ordering_aliases = {
+        'popular': ('-popularity', '-id'),
+        'favorites': ('-favorites_count', '-id'),
+        'cooking_time': ('cooking_time', 'id'),
+        'newest': ('-pub_date', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        alias = request.query_params.get(self.ordering_param)
+        if alias in self.ordering_aliases:
+            return self.ordering_aliases[alias]
+        if alias is None and request.query_params.get(RECIPE_SEARCH_PARAM):
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,241 @@
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def conditional_response(request, etag, last_modified, build_response):
+    """
+    Отвечает 304 Not Modified, если у клиента актуальная копия,
+    иначе строит ответ через build_response и проставляет валидаторы.
+    last_modified может быть None, тогда проверяется только ETag.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is None:
+        response = build_response()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ReferenceCacheMixin:
+    """
+    Отдаёт list и retrieve справочника из VersionedCache
+    без обращения к базе, с поддержкой ETag и Last-Modified.
+    """
+    reference_cache = None
+
+    def filter_cached(self, items):
+        return items
+
+    def cached_response(self, request, build_data):
+        version = self.reference_cache.version()
+        return conditional_response(
+            request,
+            self.reference_cache.etag(version),
+            self.reference_cache.last_modified(version),
+            lambda: Response(build_data(version)),
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            lambda version: self.filter_cached(
+                self.reference_cache.get(version),
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+
+        def build_data(version):
+            for item in self.reference_cache.get(version):
+                if str(item['id']) == lookup:
+                    return item
+            raise NotFound()
+
+        return self.cached_response(request, build_data)
+
+
+@lru_cache(maxsize=None)
+def timed_serializer_class(serializer_class):
+    """
+    Подкласс сериализатора, у которого построение data замеряется
+    в request.metrics из контекста.
+    """
+
+    class TimedSerializer(serializer_class):
+        @property
+        def data(self):
+            with self.context['request'].metrics.serializing():
+                return super().data
+
+    TimedSerializer.__name__ = serializer_class.__name__
+    TimedSerializer.__qualname__ = serializer_class.__qualname__
+    return TimedSerializer
+
+
+class SerializeTimingMixin:
+    """
+    Для замеряемых запросов время построения serializer.data уходит
+    в serialize_ms замеров RequestMetricsMiddleware. Сериализаторы
+    get_serializer() замеряются сами, созданные напрямую - через timed().
+    Остальные запросы работают с сериализаторами без изменений.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return self.timed(super().get_serializer(*args, **kwargs))
+
+    def timed(self, serializer):
+        if getattr(self.request, 'metrics', None) is not None:
+            serializer.__class__ = timed_serializer_class(type(serializer))
+        return serializer
+
+
+def check_required(cls, names):
+    """
+    Проверяет при объявлении класса, что в нём заданы атрибуты
+    и методы names: ошибка видна при импорте, а не на первом запросе.
+    """
+    missing = [name for name in names if getattr(cls, name, None) is None]
+    if missing:
+        raise ImproperlyConfigured(
+            f'{cls.__name__} должен задать: {", ".join(missing)}.'
+        )
+
+
+class RelationToggleMixin:
+    """
+    Добавляет и удаляет связь пользователя с объектом (избранное,
+    корзина, подписка) одной командой INSERT ... ON CONFLICT DO NOTHING
+    или DELETE. Была ли связь, видно по числу затронутых строк, поэтому
+    проверка перед записью не нужна и параллельные запросы не создают
+    дубликатов.
+
+    Подкласс задаёт target_model, target_url_kwarg, already_added_message
+    и методы add_relation(user, target) -> bool, remove_relation(user,
+    target_id) -> bool и build_relation(user, target) - объект связи
+    для ответа.
+    """
+    required_hooks = (
+        'target_model',
+        'target_url_kwarg',
+        'already_added_message',
+        'add_relation',
+        'remove_relation',
+        'build_relation',
+    )
+    target_model = None
+    target_url_kwarg = None
+    already_added_message = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        check_required(cls, cls.required_hooks)
+
+    def validate_target(self, user, target):
+        pass
+
+    def create(self, request, *args, **kwargs):
+        target = get_object_or_404(
+            self.target_model,
+            pk=kwargs[self.target_url_kwarg],
+        )
+        self.validate_target(request.user, target)
+        if not self.add_relation(request.user, target):
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.already_added_message,
+                ],
+            })
+        serializer = self.get_serializer(
+            self.build_relation(request.user, target),
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, *args, **kwargs):
+        if not self.remove_relation(
+            request.user,
+            kwargs[self.target_url_kwarg],
+        ):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RelationBatchMixin:
+    """
+    Пакетная версия RelationToggleMixin: POST добавляет, DELETE удаляет
+    связи со списком объектов {"ids": [...]} в одной транзакции одной
+    вставкой или одним удалением и возвращает статус каждого id.
+
+    Подкласс задаёт target_model и методы add_relations(user, target_ids)
+    и remove_relations(user, target_ids), возвращающие id действительно
+    добавленных или удалённых связей.
+    """
+    required_hooks = ('target_model', 'add_relations', 'remove_relations')
+    target_model = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        check_required(cls, cls.required_hooks)
+
+    def get_invalid_ids(self, user, ids):
+        return set()
+
+    def get_ids(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    def batch_response(self, ids, statuses):
+        return Response({
+            'results': [
+                {'id': target_id, 'status': statuses[target_id]}
+                for target_id in ids
+            ],
+        })
+
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        existing = set(self.target_model.objects.filter(
+            pk__in=ids,
+        ).values_list('pk', flat=True))
+        invalid = self.get_invalid_ids(request.user, ids)
+        valid = [
+            target_id for target_id in ids
+            if target_id in existing and target_id not in invalid
+        ]
+        created = set(self.add_relations(request.user, valid))
+        statuses = {}
+        for target_id in ids:
+            if target_id not in existing:
+                statuses[target_id] = 'not_found'
+            elif target_id in invalid:
+                statuses[target_id] = 'invalid'
+            elif target_id in created:
+                statuses[target_id] = 'created'
+            else:
+                statuses[target_id] = 'exists'
+        return self.batch_response(ids, statuses)
+
+    @transaction.atomic
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        removed = set(self.remove_relations(request.user, ids))
+        return self.batch_response(ids, {
+            target_id: 'removed' if target_id in removed else 'not_found'
+            for target_id in ids
+        })
@@ -1,6 +1,61 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+PAGINATION_MODE_PARAM = 'pagination'
+CURSOR_MODE = 'cursor'
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = settings.PAGINATION_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация: страница выбирается по ключу сортировки,
+    без OFFSET и без COUNT(*), поэтому не замедляется с глубиной.
+    """
+    page_size = settings.PAGINATION_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+
+
+class RecipeCursorPagination(LimitCursorPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class FeedCursorPagination(LimitCursorPagination):
+    """
+    Лента всегда идёт по дате публикации: параметр ordering фильтров
+    вьюсета рецептов к записям ленты не относится и не учитывается.
+    """
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class FollowCursorPagination(LimitCursorPagination):
+    ordering = ('-id',)
+
+
+class CursorPaginationMixin:
+    """
+    Включает курсорную пагинацию по параметру ?pagination=cursor.
+    Без параметра вьюсет использует свой pagination_class.
+    """
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        request = getattr(self, 'request', None)
+        if (
+            self.cursor_pagination_class is None
+            or request is None
+            or request.query_params.get(PAGINATION_MODE_PARAM) != CURSOR_MODE
+        ):
+            return super().paginator
+        if not hasattr(self, '_cursor_paginator'):
+            self._cursor_paginator = self.cursor_pagination_class()
+        return self._cursor_paginator
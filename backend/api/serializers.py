@@ -1,19 +1,23 @@
+from django.conf import settings
+from django.db import transaction
 from djoser.serializers import (
     PasswordSerializer, UserCreateSerializer, UserSerializer
 )
 from drf_extra_fields.fields import Base64ImageField
+from recipes import images
 from recipes.models import (
-    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag,
-    TagRecipe
+    Favorite, Ingredient, IngredientRecipe, Recipe, RecipeSearch, ShoppingCart,
+    ShoppingListItem, Tag, TagRecipe
 )
-from rest_framework.generics import get_object_or_404
 from rest_framework.serializers import (
-    CharField, CurrentUserDefault, HiddenField, IntegerField, ListField,
-    ModelSerializer, PrimaryKeyRelatedField, ReadOnlyField,
+    BooleanField, CharField, CurrentUserDefault, HiddenField, ImageField,
+    IntegerField, ListField, ModelSerializer, ReadOnlyField, Serializer,
     SerializerMethodField, ValidationError
 )
 from users.models import Follow, User
 
+from .uploads import check_image_pixels, check_image_size
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
@@ -40,9 +44,14 @@ class CustomUserSerializer(UserSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
+            'recipes_count',
+            'followers_count',
         )
+        read_only_fields = ('recipes_count', 'followers_count')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return user.is_authenticated and Follow.objects.filter(
             user=user,
@@ -76,11 +85,54 @@ class IngredientInRecipePostSerializer(ModelSerializer):
         required_fields = ('id', 'amount')
 
 
+# Поля рецепта, которые попадают в поисковый документ RecipeSearch.
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def missing_ids(model, ids):
+    """
+    id из ids, которых нет в таблице model, одним запросом;
+    строка для сообщения об ошибке или пустая строка.
+    """
+    found = set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+    return ', '.join(str(pk) for pk in ids if pk not in found)
+
+
+class LimitedBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField с лимитами RECIPE_IMAGE_MAX_BYTES и
+    RECIPE_IMAGE_MAX_PIXELS. Размер файла оценивается по длине строки
+    ещё до декодирования.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            marker = data.find(';base64,')
+            encoded_length = len(data) - (marker + 8 if marker >= 0 else 0)
+            check_image_size(encoded_length * 3 // 4)
+        image = super().to_internal_value(data)
+        if image is not None:
+            check_image_pixels(image)
+        return image
+
+
+class UploadedImageField(ImageField):
+    """
+    Картинка файлом из multipart или тела запроса, с теми же лимитами.
+    """
+
+    def to_internal_value(self, data):
+        check_image_size(getattr(data, 'size', 0))
+        image = super().to_internal_value(data)
+        check_image_pixels(image)
+        return image
+
+
 class RecipePostSerializer(ModelSerializer):
     ingredients = IngredientInRecipePostSerializer(many=True)
-    tags = ListField(child=PrimaryKeyRelatedField(queryset=Tag.objects.all()))
+    tags = ListField(child=IntegerField())
     author = HiddenField(default=CurrentUserDefault())
-    image = Base64ImageField()
+    image = LimitedBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -93,6 +145,12 @@ class RecipePostSerializer(ModelSerializer):
             'text',
             'cooking_time',
         )
+        read_only_fields = (
+            'favorites_count',
+            'shopping_cart_count',
+            'popularity',
+            'image_status',
+        )
 
     def validate_name(self, name):
         if not name:
@@ -119,6 +177,9 @@ class RecipePostSerializer(ModelSerializer):
             if ingredient_id in ingredients_list:
                 raise ValidationError('Вы добавили повторяющийся ингредиент!')
             ingredients_list.append(ingredient_id)
+        missing = missing_ids(Ingredient, ingredients_list)
+        if missing:
+            raise ValidationError(f'Ингредиенты не найдены: {missing}')
         return ingredients
 
     def validate_tags(self, tags):
@@ -129,6 +190,9 @@ class RecipePostSerializer(ModelSerializer):
             if tag in tags_list:
                 raise ValidationError('Теги должны быть уникальными!')
             tags_list.append(tag)
+        missing = missing_ids(Tag, tags_list)
+        if missing:
+            raise ValidationError(f'Теги не найдены: {missing}')
         return tags
 
     def validate_cooking_time(self, cooking_time):
@@ -138,44 +202,144 @@ class RecipePostSerializer(ModelSerializer):
             )
         return cooking_time
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
 
         TagRecipe.objects.bulk_create(
-            [TagRecipe(tag=tag, recipe=recipe) for tag in tags]
+            [TagRecipe(tag_id=tag_id, recipe=recipe) for tag_id in tags]
         )
         IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(
-                ingredient=get_object_or_404(
-                    Ingredient,
-                    id=ingredient.get('id'),
-                ),
-                amount=ingredient.get('amount'),
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'],
                 recipe=recipe,
             ) for ingredient in ingredients]
         )
+        RecipeSearch.objects.refresh([recipe.pk])
+        images.enqueue(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        recipe = super().update(instance, validated_data)
+        if ingredients is not None or SEARCH_FIELDS & validated_data.keys():
+            RecipeSearch.objects.refresh([recipe.pk])
+        if 'image' in validated_data:
+            images.enqueue(recipe)
+        return recipe
 
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        ingredients = validated_data.pop('ingredients')
-        IngredientRecipe.objects.bulk_create(
-            [IngredientRecipe(
-                ingredient=get_object_or_404(
-                    Ingredient,
-                    id=ingredient.get('id'),
-                ),
-                amount=ingredient.get('amount'),
-                recipe=instance,
-            ) for ingredient in ingredients]
+    @staticmethod
+    def update_tags(recipe, tags):
+        """
+        Добавляет и удаляет только изменившиеся теги рецепта.
+        """
+        current = set(TagRecipe.objects.filter(
+            recipe=recipe,
+        ).values_list('tag_id', flat=True))
+        removed = current - set(tags)
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe,
+                tag_id__in=removed,
+            ).delete()
+        TagRecipe.objects.bulk_create(
+            [
+                TagRecipe(tag_id=tag_id, recipe=recipe)
+                for tag_id in tags if tag_id not in current
+            ]
+        )
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Сравнивает новые ингредиенты с сохранёнными и пачкой вставляет,
+        обновляет и удаляет только отличающиеся строки; та же разница
+        переносится в списки покупок. Дату изменения рецепта один раз
+        сдвигает его сохранение в update().
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        to_create, to_update = [], []
+        for ingredient_id, amount in new_amounts.items():
+            row = rows.get(ingredient_id)
+            if row is None:
+                to_create.append(IngredientRecipe(
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                    recipe=recipe,
+                ))
+            elif row.amount != amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [
+            row.id for ingredient_id, row in rows.items()
+            if ingredient_id not in new_amounts
+        ]
+        if to_delete:
+            IngredientRecipe.objects.filter(id__in=to_delete).delete()
+        IngredientRecipe.objects.bulk_create(to_create)
+        IngredientRecipe.objects.bulk_update(to_update, ('amount',))
+        ShoppingListItem.objects.change_recipe(
+            recipe,
+            old_amounts,
+            new_amounts,
         )
-        return super().update(instance, validated_data)
+
+
+class RecipeImageSerializer(ModelSerializer):
+    image = UploadedImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        recipe = super().update(instance, validated_data)
+        images.enqueue(recipe)
+        return recipe
+
+
+class ImageVariantsField(ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии картинки рецепта:
+    {вариант: {формат: URL}}, или null, пока картинка не обработана.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = images.variant_urls(recipe)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            variant: {
+                image_format: request.build_absolute_uri(url)
+                for image_format, url in formats.items()
+            }
+            for variant, formats in urls.items()
+        }
 
 
 class IngredientInRecipeGetSerializer(ModelSerializer):
@@ -196,32 +360,40 @@ class RecipeGetSerializer(ModelSerializer):
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
-    is_favorited = SerializerMethodField()
-    is_in_shopping_cart = SerializerMethodField()
+    image_variants = ImageVariantsField()
+    is_favorited = BooleanField(read_only=True)
+    is_in_shopping_cart = BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = '__all__'
 
-    def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and Favorite.objects.filter(
-            user=user,
-            favorite_recipe=obj,
-        ).exists()
-
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and ShoppingCart.objects.filter(
-            user=user,
-            recipe=obj,
-        ).exists()
-
 
 class RecipeInFollowSerializer(ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id',
+            'name',
+            'image',
+            'image_status',
+            'image_variants',
+            'cooking_time',
+        )
+
+
+def get_recipes_limit(request):
+    """
+    Значение ?recipes_limit=; None (без ограничения), если параметр
+    не задан, некорректен или не больше нуля.
+    """
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
 
 
 class FollowSerializer(ModelSerializer):
@@ -247,7 +419,7 @@ class FollowSerializer(ModelSerializer):
     )
     is_subscribed = SerializerMethodField()
     recipes = SerializerMethodField()
-    recipes_count = ReadOnlyField(source='author.recipes.count')
+    recipes_count = ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Follow
@@ -262,31 +434,22 @@ class FollowSerializer(ModelSerializer):
             'recipes_count',
         )
 
-    def validate(self, data):
-        user = User.objects.get(id=self.context['request'].user.id)
-        author = User.objects.get(id=self.context['author_id'])
-        if user == author:
-            raise ValidationError('Нельзя подписаться на самого себя!')
-        if Follow.objects.filter(user=user, author=author).exists():
-            raise ValidationError('Вы уже подписаны на этого автора!')
-        return data
-
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=self.context['request'].user,
-            author=obj.author,
-        ).exists()
+        """
+        obj - подписка текущего пользователя, так что флаг всегда True.
+        """
+        return True
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
-        limit = self.context.get('request').query_params.get('recipes_limit')
-        if limit:
-            try:
-                limit = int(limit)
-                queryset = queryset[:limit]
-            except ValueError:
-                pass
-        serializer = RecipeInFollowSerializer(queryset, many=True)
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.author_id, [])
+        else:
+            recipes = obj.author.recipes.all()
+            limit = get_recipes_limit(self.context['request'])
+            if limit is not None:
+                recipes = recipes[:limit]
+        serializer = RecipeInFollowSerializer(recipes, many=True)
         return serializer.data
 
 
@@ -312,16 +475,6 @@ class FavoriteSerializer(ModelSerializer):
         model = Favorite
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        user = User.objects.get(id=self.context['request'].user.id)
-        favorite_recipe = Recipe.objects.get(id=self.context['recipe_id'])
-        if Favorite.objects.filter(
-                user=user,
-                favorite_recipe=favorite_recipe,
-        ).exists():
-            raise ValidationError('Этот товар уже есть у вас в избранном!')
-        return data
-
 
 class ShoppingCartCreateDestroySerializer(ModelSerializer):
     id = IntegerField(source='recipe.id', read_only=True)
@@ -333,11 +486,13 @@ class ShoppingCartCreateDestroySerializer(ModelSerializer):
         model = ShoppingCart
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        user = User.objects.get(id=self.context['request'].user.id)
-        recipe = Recipe.objects.get(id=self.context['recipe_id'])
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            raise ValidationError(
-                'Этот товар уже есть в вашем списке покупок!'
-            )
-        return data
+
+class RelationBatchSerializer(Serializer):
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATION_BATCH_MAX_SIZE,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
@@ -0,0 +1,31 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    transaction.on_commit(partial(token_cache.invalidate, instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    for key in Token.objects.filter(user=instance).values_list(
+        'key',
+        flat=True,
+    ):
+        transaction.on_commit(partial(token_cache.invalidate, key))
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_token(sender, request, user, **kwargs):
+    token = getattr(request, 'auth', None)
+    if isinstance(token, Token):
+        transaction.on_commit(partial(token_cache.invalidate, token.key))
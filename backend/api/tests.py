@@ -0,0 +1,477 @@
+import pickle
+import time
+from unittest.mock import patch
+
+from core.middleware import route_metrics
+from django.core.cache import cache
+from django.db.models import Max
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag,
+    TagRecipe, favorites_cache
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+from .authentication import token_cache
+from .serializers import RecipeGetSerializer
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-tests',
+    },
+}
+
+METRICS_LOGGER = 'core.middleware'
+
+
+def create_recipes(author, count, tags, ingredients):
+    """
+    Создаёт count рецептов автора, каждый со всеми тегами
+    и ингредиентами.
+    """
+    last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/test.png',
+        )
+        for number in range(count)
+    )
+    recipes = list(Recipe.objects.filter(id__gt=last_id))
+    TagRecipe.objects.bulk_create(
+        TagRecipe(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in tags
+    )
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+        for recipe in recipes
+        for ingredient in ingredients
+    )
+    return recipes
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=0)
+class RecipeListQueriesTest(TestCase):
+    """
+    Число запросов к базе на список рецептов не зависит от рецептов
+    страницы и их флагов для пользователя.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                slug=f'tag-{number}',
+                color='#000000',
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г',
+            )
+            for number in range(5)
+        ]
+        cls.recipes = create_recipes(cls.author, 10, tags, ingredients)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.add(cls.user, recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.add(cls.user, recipe)
+        cls.user.follower.create(author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_authenticated_list(self):
+        # Избранное и корзина пользователя, COUNT, валидаторы страницы,
+        # рецепты, авторы, ингредиенты и теги.
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 6)
+        favorited = {recipe.id for recipe in self.recipes[::2]}
+        in_cart = {recipe.id for recipe in self.recipes[::3]}
+        for result in results:
+            self.assertEqual(result['is_favorited'], result['id'] in favorited)
+            self.assertEqual(
+                result['is_in_shopping_cart'],
+                result['id'] in in_cart,
+            )
+            self.assertTrue(result['author']['is_subscribed'])
+            self.assertEqual(len(result['tags']), 3)
+            self.assertEqual(len(result['ingredients']), 5)
+
+    def test_page_sizes(self):
+        # Число запросов не растёт с размером страницы.
+        create_recipes(
+            self.author,
+            200,
+            Tag.objects.all(),
+            Ingredient.objects.all(),
+        )
+        for page_size in (6, 50, 200):
+            with self.subTest(page_size=page_size):
+                cache.clear()
+                with self.assertNumQueries(8):
+                    response = self.client.get(
+                        f'/api/recipes/?limit={page_size}',
+                    )
+                self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_authenticated_list_warm_cache(self):
+        # Избранное и корзина берутся из кэша.
+        self.client.get('/api/recipes/')
+        with self.assertNumQueries(6):
+            self.client.get('/api/recipes/?page=2')
+
+    def test_anonymous_list(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        for result in response.json()['results']:
+            self.assertFalse(result['is_favorited'])
+            self.assertFalse(result['is_in_shopping_cart'])
+
+    def test_not_modified(self):
+        # Для 304 сериализация и выборка рецептов не нужны.
+        etag = self.client.get('/api/recipes/')['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/',
+                HTTP_IF_NONE_MATCH=etag,
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_after_unfavorite(self):
+        # Флаги пользователя меняются без сдвига даты изменения рецепта,
+        # поэтому деталь отдаёт только ETag.
+        recipe = self.recipes[0]
+        path = f'/api/recipes/{recipe.id}/'
+        response = self.client.get(path)
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        Favorite.objects.remove(self.user, recipe.id)
+        # В TestCase коммита нет, и кэш избранного сбрасывается вручную.
+        favorites_cache.invalidate(self.user.pk)
+        response = self.client.get(
+            path,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time()),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_favorited'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=0)
+class SubscriptionsTest(TestCase):
+    """
+    Подписки и пакетная подписка, когда авторов для выборки рецептов нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        cls.author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        create_recipes(cls.author, 3, [], [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_no_subscriptions(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_subscriptions(self):
+        self.user.follower.create(author=self.author)
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=2',
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(results[0]['recipes']), 2)
+
+    def test_queries(self):
+        # Подписки страницы и рецепты всех их авторов, плюс COUNT
+        # для постраничной пагинации.
+        for number in range(10):
+            author = User.objects.create(
+                username=f'author-{number}',
+                email=f'author-{number}@example.com',
+            )
+            create_recipes(author, 5, [], [])
+            self.user.follower.create(author=author)
+        for query, queries in (
+            ('limit=2&recipes_limit=1', 3),
+            ('limit=10&recipes_limit=1', 3),
+            ('limit=10&recipes_limit=5', 3),
+            ('limit=10', 3),
+            ('pagination=cursor&limit=2&recipes_limit=1', 2),
+            ('pagination=cursor&limit=10&recipes_limit=5', 2),
+        ):
+            with self.subTest(query=query):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        f'/api/users/subscriptions/?{query}',
+                    )
+                self.assertEqual(response.status_code, 200)
+
+    def test_no_subscriptions_cursor(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?pagination=cursor',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_batch_subscribe_already_subscribed(self):
+        self.user.follower.create(author=self.author)
+        response = self.client.post(
+            '/api/users/subscribe/',
+            {'ids': [self.author.id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.author.id, 'status': 'exists'}],
+        )
+        self.assertEqual(self.user.feed.count(), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=0)
+class FeedTest(TestCase):
+    """
+    Лента идёт по дате публикации при любом параметре ordering.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        recipes = create_recipes(author, 3, [], [])
+        cls.recipe_ids = sorted(
+            (recipe.id for recipe in recipes),
+            reverse=True,
+        )
+        cls.user.follower.create(author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ordering_ignored(self):
+        for query in (
+            'ordering=favorites_count',
+            'ordering=popular',
+            'pagination=cursor',
+            'pagination=cursor&ordering=favorites_count',
+            'pagination=cursor&ordering=popular',
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/feed/?{query}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [recipe['id'] for recipe in response.json()['results']],
+                    self.recipe_ids,
+                )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTest(TestCase):
+    """
+    Время сериализации замеряется отдельно от остального времени view.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        create_recipes(cls.user, 3, [], [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def server_timing(self, response):
+        return {
+            name: float(duration[len('dur='):])
+            for name, duration, *_ in (
+                entry.split(';')
+                for entry in response['Server-Timing'].split(', ')
+            )
+        }
+
+    def test_serialize_timing(self):
+        # Медленная сериализация рецепта попадает в serialize, а не в app.
+        to_representation = RecipeGetSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.1)
+            return to_representation(serializer, instance)
+
+        recipe_id = self.user.recipes.first().id
+        with patch.object(RecipeGetSerializer, 'to_representation', slow):
+            for path in ('/api/recipes/', f'/api/recipes/{recipe_id}/'):
+                with self.subTest(path=path):
+                    with self.assertLogs(METRICS_LOGGER):
+                        response = self.client.get(path)
+                    self.assertEqual(response.status_code, 200)
+                    timing = self.server_timing(response)
+                    self.assertGreaterEqual(timing['serialize'], 100)
+                    self.assertLess(timing['app'], 100)
+
+    def test_summary(self):
+        with self.assertLogs(METRICS_LOGGER):
+            self.client.get('/api/users/me/')
+        self.assertIn(
+            'serialize_ms',
+            route_metrics.summary()['routes']['GET api:users-me'],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=0)
+class RecipeUpdateQueriesTest(TestCase):
+    """
+    Число запросов на правку ингредиентов рецепта не зависит от того,
+    сколько строк удаляется.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г',
+            )
+            for number in range(80)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_shrink_ingredients(self):
+        for size in (16, 40, 80):
+            with self.subTest(size=size):
+                cache.clear()
+                recipe, = create_recipes(
+                    self.author,
+                    1,
+                    [],
+                    self.ingredients[:size],
+                )
+                updated = recipe.updated
+                # Рецепт, пользователь, проверка ингредиентов, строки
+                # рецепта, одно удаление и одно обновление строк, корзины,
+                # сохранение рецепта с датой изменения, поисковый
+                # документ, избранное и корзина для ответа и сам ответ.
+                with self.assertNumQueries(24):
+                    response = self.client.patch(
+                        f'/api/recipes/{recipe.id}/',
+                        {
+                            'ingredients': [
+                                {'id': ingredient.id, 'amount': 5}
+                                for ingredient in self.ingredients[:8]
+                            ],
+                        },
+                        format='json',
+                    )
+                self.assertEqual(response.status_code, 200)
+                recipe.refresh_from_db()
+                self.assertGreater(recipe.updated, updated)
+                self.assertEqual(
+                    IngredientRecipe.objects.filter(recipe=recipe).count(),
+                    8,
+                )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REQUEST_METRICS_SAMPLE_RATE=0)
+class TokenCacheTest(TestCase):
+    """
+    В общий кэш токенов не попадает хэш пароля пользователя.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user',
+            email='user@example.com',
+            password='old-Passw0rd',
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.local.delete(token_cache.cache_key(self.token.key))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_password_not_cached(self):
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        cached = cache.get(token_cache.cache_key(self.token.key))
+        self.assertEqual(cached.user.pk, self.user.pk)
+        self.assertNotIn('password', cached.user.__dict__)
+        self.assertNotIn(
+            self.user.password.encode(),
+            pickle.dumps(cached),
+        )
+
+    def test_set_password(self):
+        # Отложенный пароль читается из базы при проверке.
+        self.client.get('/api/users/me/')
+        response = self.client.post(
+            '/api/users/set_password/',
+            {
+                'current_password': 'old-Passw0rd',
+                'new_password': 'new-Passw0rd',
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 204)
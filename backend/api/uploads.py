@@ -0,0 +1,123 @@
+import mimetypes
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    FileUploadHandler, TemporaryFileUploadHandler
+)
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.parsers import DataAndFiles, FileUploadParser, JSONParser
+
+# Заголовки и границы multipart поверх самого файла.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+def check_content_length(request, limit):
+    """
+    Отклоняет запрос по заголовку Content-Length, не читая тело.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > limit:
+        raise RequestTooLarge(f'Размер запроса больше {limit} байт.')
+
+
+def check_image_size(size):
+    limit = settings.RECIPE_IMAGE_MAX_BYTES
+    if size > limit:
+        raise ValidationError(f'Картинка больше {limit} байт.')
+
+
+def check_image_pixels(file):
+    """
+    Проверяет размеры картинки по заголовку, который уже прочитал
+    ImageField; сами пиксели при этом не декодируются.
+    """
+    width, height = file.image.size
+    limit = settings.RECIPE_IMAGE_MAX_PIXELS
+    if width * height > limit:
+        raise ValidationError(
+            f'Картинка {width}x{height} больше {limit} пикселей.'
+        )
+
+
+class LimitedJSONParser(JSONParser):
+    """
+    JSONParser, который отклоняет тело больше RECIPE_JSON_MAX_BYTES
+    до того, как прочитать его в память.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(
+            parser_context['request'],
+            settings.RECIPE_JSON_MAX_BYTES,
+        )
+        return super().parse(stream, media_type, parser_context)
+
+
+class ImageUploadParser(FileUploadParser):
+    """
+    Картинка телом запроса с Content-Type image/*. Имя файла берётся
+    из Content-Disposition, а если его нет - из типа содержимого.
+    """
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        return DataAndFiles({}, {'image': result.files['file']})
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        content_type = media_type.split(';')[0].strip()
+        return 'image' + (mimetypes.guess_extension(content_type) or '')
+
+
+class ImageUploadLimitHandler(FileUploadHandler):
+    """
+    Первый обработчик загрузки: обрывает приём, как только тело
+    запроса или файл превысили RECIPE_IMAGE_MAX_BYTES, не дожидаясь
+    конца загрузки.
+    """
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        limit = settings.RECIPE_IMAGE_MAX_BYTES
+        if boundary:
+            limit += MULTIPART_OVERHEAD_BYTES
+        if content_length > limit:
+            raise RequestTooLarge(f'Размер запроса больше {limit} байт.')
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        limit = settings.RECIPE_IMAGE_MAX_BYTES
+        if self.received > limit:
+            raise RequestTooLarge(f'Картинка больше {limit} байт.')
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def image_upload_handlers(request):
+    """
+    Обработчики для загрузки картинки: лимит размера и запись потоком
+    во временный файл вместо буфера в памяти.
+    """
+    return [
+        ImageUploadLimitHandler(request),
+        TemporaryFileUploadHandler(request),
+    ]
@@ -2,9 +2,11 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    CustomUserViewSet, FavoriteViewSet, FollowCreateDestroyViewSet,
-    FollowListViewSet, IngredientViewSet, RecipeViewSet,
-    ShoppingCartCreateDestroyViewSet, ShoppingCartDownloadAPIView, TagViewSet
+    AuthCacheStatsAPIView, CustomUserViewSet, FavoriteBatchViewSet,
+    FavoriteViewSet, FollowBatchViewSet, FollowCreateDestroyViewSet,
+    FollowListViewSet, IngredientViewSet, RecipeViewSet, RequestMetricsAPIView,
+    ShoppingCartBatchViewSet, ShoppingCartCreateDestroyViewSet,
+    ShoppingCartDownloadAPIView, TagViewSet
 )
 
 app_name = 'api'
@@ -16,6 +18,11 @@ router.register(
     FollowListViewSet,
     basename='subscriptions'
 )
+router.register(
+    'users/subscribe',
+    FollowBatchViewSet,
+    basename='subscribe_batch'
+)
 router.register(
     r'users/(?P<user_id>\d+)/subscribe',
     FollowCreateDestroyViewSet,
@@ -25,11 +32,21 @@ router.register('users', CustomUserViewSet, basename='users')
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
+router.register(
+    'recipes/favorite',
+    FavoriteBatchViewSet,
+    basename='favorite_batch'
+)
 router.register(
     r'recipes/(?P<recipe_id>\d+)/favorite',
     FavoriteViewSet,
     basename='favorite'
 )
+router.register(
+    'recipes/shopping_cart',
+    ShoppingCartBatchViewSet,
+    basename='shopping_cart_batch'
+)
 router.register(
     r'recipes/(?P<recipe_id>\d+)/shopping_cart',
     ShoppingCartCreateDestroyViewSet,
@@ -38,7 +55,9 @@ router.register(
 
 
 urlpatterns = [
+    path('auth/cache-stats/', AuthCacheStatsAPIView.as_view()),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', RequestMetricsAPIView.as_view()),
     path(
         'recipes/download_shopping_cart/',
         ShoppingCartDownloadAPIView.as_view()
@@ -1,31 +1,62 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+from hashlib import sha1
+
+from core.middleware import route_metrics
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
+from recipes.autocomplete import ingredient_index
+from recipes.cache import ingredients_cache, tags_cache
 from recipes.models import (
-    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+    Favorite, FeedEntry, Ingredient, Recipe, ShoppingCart, Tag
 )
 from rest_framework import mixins, permissions, status, views, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from users.models import Follow, User
 
-from .filters import IngredientSearchFilter, RecipesFilter
-from .pagination import LimitPageNumberPagination
+from .authentication import token_cache
+from .exporters import EXPORT_FORMATS
+from .filters import (
+    IngredientSearchFilter, RecipeOrderingFilter, RecipesFilter
+)
+from .mixins import (
+    ReferenceCacheMixin, RelationBatchMixin, RelationToggleMixin,
+    SerializeTimingMixin, conditional_response
+)
+from .negotiation import IgnoreFormatContentNegotiation
+from .pagination import (
+    CursorPaginationMixin, FeedCursorPagination, FollowCursorPagination,
+    LimitPageNumberPagination, RecipeCursorPagination
+)
 from .permissions import (
     AdminPermission, CurrentUserPermission, ReadOnlyPermission
 )
 from .serializers import (
     CustomPasswordSerializer, CustomUserCreateSerializer, CustomUserSerializer,
     FavoriteSerializer, FollowSerializer, IngredientSerializer,
-    RecipeGetSerializer, RecipePostSerializer,
-    ShoppingCartCreateDestroySerializer, TagSerializer
+    RecipeGetSerializer, RecipeImageSerializer, RecipePostSerializer,
+    RelationBatchSerializer, ShoppingCartCreateDestroySerializer,
+    TagSerializer, get_recipes_limit
+)
+from .uploads import (
+    ImageUploadParser, LimitedJSONParser, image_upload_handlers
 )
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(SerializeTimingMixin, UserViewSet):
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ('recipes_count', 'followers_count')
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -40,45 +71,206 @@ class CustomUserViewSet(UserViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        return User.objects.all()
+        return User.objects.annotate_is_subscribed(self.request.user)
+
+    def get_instance(self):
+        """
+        Профиль текущего пользователя читается из базы, а не берётся
+        из кэша аутентификации: счётчики рецептов и подписчиков
+        меняются без сохранения пользователя.
+        """
+        return self.get_queryset().get(pk=self.request.user.pk)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminPermission | ReadOnlyPermission,)
+    reference_cache = tags_cache
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminPermission | ReadOnlyPermission,)
     filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
+    reference_cache = ingredients_cache
+
+    def filter_cached(self, items):
+        name = self.request.query_params.get(
+            IngredientSearchFilter.search_param,
+        )
+        if not name:
+            return items
+        return ingredient_index.starts_with(name)
+
+    @action(methods=['get'], detail=False)
+    def autocomplete(self, request):
+        """
+        Подсказки для редактора рецепта из индекса в памяти:
+        сначала совпадения по началу названия, затем по вхождению.
+        """
+        try:
+            limit = int(request.query_params.get(
+                'limit',
+                settings.INGREDIENT_AUTOCOMPLETE_LIMIT,
+            ))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число.'})
+        limit = min(limit, settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT)
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            limit,
+        ))
+
+
+RECIPE_VALIDATOR_FIELDS = (
+    'id',
+    'pub_date',
+    'updated',
+    'cooking_time',
+    'image_status',
+    'is_favorited',
+    'is_in_shopping_cart',
+    'favorites_count',
+    'shopping_cart_count',
+    'popularity',
+    'is_author_subscribed',
+    'author__email',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'author__recipes_count',
+    'author__followers_count',
+)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+class RecipeViewSet(
+    SerializeTimingMixin,
+    CursorPaginationMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = (
         AdminPermission | CurrentUserPermission | ReadOnlyPermission,
     )
     pagination_class = LimitPageNumberPagination
-    filter_backends = (DjangoFilterBackend,)
+    cursor_pagination_class = RecipeCursorPagination
+    lookup_value_regex = r'\d+'
+    parser_classes = (LimitedJSONParser, FormParser, MultiPartParser)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipesFilter
+    ordering_fields = (
+        'pub_date',
+        'cooking_time',
+        'favorites_count',
+        'shopping_cart_count',
+        'popularity',
+    )
+    ordering = ('-pub_date', '-id')
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read(self.request.user)
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
+        if self.action == 'image':
+            return RecipeImageSerializer
         return RecipePostSerializer
 
+    def get_validator_queryset(self):
+        """
+        Поля, от которых зависит ответ для пользователя: версия рецепта,
+        его флаги и данные автора. По ним строится ETag без сериализации.
+        """
+        user = self.request.user
+        return Recipe.objects.annotate_user_flags(
+            user,
+        ).annotate_author_subscription(user).values(*RECIPE_VALIDATOR_FIELDS)
+
+    def conditional(self, request, payload, build_response):
+        """
+        Ответ рецептов проверяется только по ETag. Last-Modified не
+        отдаётся: флаги пользователя, подписка на автора и счётчики
+        меняются без сдвига даты изменения рецепта.
+        """
+        digest = sha1(repr((
+            request.user.pk,
+            tags_cache.version(),
+            ingredients_cache.version(),
+            payload,
+        )).encode()).hexdigest()
+        response = conditional_response(
+            request,
+            f'"{digest}"',
+            None,
+            build_response,
+        )
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        ETag страницы считается по фильтрам, ссылкам пагинации и
+        валидаторам рецептов страницы.
+        """
+        rows = self.paginate_queryset(
+            self.filter_queryset(self.get_validator_queryset()),
+        )
+        return self.conditional(
+            request,
+            (
+                request.get_full_path(),
+                self.get_paginated_response(rows).data,
+            ),
+            partial(self.list_page, rows),
+        )
+
+    def list_page(self, rows):
+        """
+        Ответ строится по странице, уже выбранной для ETag: рецепты
+        читаются по id этой страницы, а ссылки и count берутся из того
+        же состояния пагинатора, без повторных COUNT и выборки страницы.
+        """
+        recipes = self.get_queryset().in_bulk(
+            [row['id'] for row in rows],
+        )
+        serializer = self.get_serializer(
+            [recipes[row['id']] for row in rows if row['id'] in recipes],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.get_validator_queryset(),
+            pk=kwargs[lookup_url_kwarg],
+        )
+        return self.conditional(
+            request,
+            row,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def get_read_instance(self, instance):
+        """
+        Перечитывает рецепт выборкой для чтения, чтобы в ответе
+        на запись были те же вычисленные поля, что и при чтении.
+        """
+        return Recipe.objects.for_read(self.request.user).get(pk=instance.pk)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        serializer = RecipeGetSerializer(
-            instance=serializer.instance,
+        serializer = self.timed(RecipeGetSerializer(
+            instance=self.get_read_instance(serializer.instance),
             context={'request': self.request}
-        )
+        ))
         return Response(
             serializer.data, status=status.HTTP_201_CREATED,
         )
@@ -92,10 +284,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
-        serializer = RecipeGetSerializer(
-            instance=serializer.instance,
+        serializer = self.timed(RecipeGetSerializer(
+            instance=self.get_read_instance(serializer.instance),
             context={'request': self.request},
-        )
+        ))
         return Response(
             serializer.data, status=status.HTTP_200_OK,
         )
@@ -103,129 +295,264 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        methods=['put'],
+        detail=True,
+        parser_classes=(MultiPartParser, ImageUploadParser),
+    )
+    def image(self, request, pk=None):
+        """
+        Замена картинки рецепта файлом: multipart/form-data с полем image
+        или телом запроса с Content-Type image/*. Файл пишется потоком
+        во временный файл, а лимиты размера проверяются до декодирования.
+        """
+        instance = self.get_object()
+        request.upload_handlers = image_upload_handlers(request)
+        serializer = self.get_serializer(instance, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        # Картинку тела запроса DRF не закрывает сам, в отличие от multipart.
+        serializer.validated_data['image'].close()
+        serializer = self.timed(RecipeGetSerializer(
+            instance=self.get_read_instance(instance),
+            context={'request': self.request},
+        ))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        cursor_pagination_class=FeedCursorPagination,
+        filter_backends=(),
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь,
+        читается из заранее разложенных записей FeedEntry.
+        """
+        entries = self.paginate_queryset(
+            request.user.feed.prefetch_related(Prefetch(
+                'recipe',
+                queryset=Recipe.objects.for_read(request.user),
+            ))
+        )
+        serializer = self.timed(RecipeGetSerializer(
+            [entry.recipe for entry in entries],
+            many=True,
+            context=self.get_serializer_context(),
+        ))
+        return self.get_paginated_response(serializer.data)
 
-class FollowBaseViewSet(viewsets.GenericViewSet):
+
+class FollowBaseViewSet(SerializeTimingMixin, viewsets.GenericViewSet):
     serializer_class = FollowSerializer
 
     def get_queryset(self):
         return self.request.user.follower.all()
 
 
-class FollowListViewSet(mixins.ListModelMixin, FollowBaseViewSet):
+class FollowListViewSet(
+    CursorPaginationMixin,
+    mixins.ListModelMixin,
+    FollowBaseViewSet,
+):
     pagination_class = LimitPageNumberPagination
+    cursor_pagination_class = FollowCursorPagination
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('author').order_by(
+            '-id',
+        )
 
-class FollowCreateDestroyViewSet(
-    mixins.CreateModelMixin,
-    mixins.DestroyModelMixin,
-    FollowBaseViewSet,
-):
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['author_id'] = self.kwargs.get('user_id')
+        context['recipes_by_author'] = getattr(
+            self,
+            'recipes_by_author',
+            None,
+        )
         return context
 
-    def perform_create(self, serializer):
-        serializer.save(
-            user=self.request.user,
-            author=get_object_or_404(User, id=self.kwargs.get('user_id')),
+    def list(self, request, *args, **kwargs):
+        """
+        Рецепты всех авторов страницы загружаются одним запросом,
+        число запросов не зависит ни от размера страницы,
+        ни от recipes_limit.
+        """
+        follows = self.paginate_queryset(self.get_queryset())
+        self.recipes_by_author = Recipe.objects.only(
+            'id', 'name', 'image', 'image_status', 'cooking_time', 'author',
+            'pub_date',
+        ).latest_by_author(
+            [follow.author_id for follow in follows],
+            get_recipes_limit(request),
         )
+        serializer = self.get_serializer(follows, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class FollowCreateDestroyViewSet(RelationToggleMixin, FollowBaseViewSet):
+    target_model = User
+    target_url_kwarg = 'user_id'
+    already_added_message = 'Вы уже подписаны на этого автора!'
+
+    def validate_target(self, user, author):
+        if user == author:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Нельзя подписаться на самого себя!',
+                ],
+            })
+
+    @transaction.atomic
+    def add_relation(self, user, author):
+        created = Follow.objects.add(user, author)
+        if created:
+            FeedEntry.objects.backfill(user.id, author.id)
+        return created
+
+    @transaction.atomic
+    def remove_relation(self, user, author_id):
+        removed = Follow.objects.remove(user, author_id)
+        if removed:
+            FeedEntry.objects.remove_author(user.id, author_id)
+        return removed
+
+    def build_relation(self, user, author):
+        return Follow(user=user, author=author)
+
+
+class FollowBatchViewSet(RelationBatchMixin, viewsets.GenericViewSet):
+    serializer_class = RelationBatchSerializer
+    target_model = User
+
+    def get_invalid_ids(self, user, author_ids):
+        return {user.id}
 
-    @action(methods=['delete'], detail=True)
-    def delete(self, request, user_id):
-        get_object_or_404(
-            Follow,
-            user=request.user,
-            author_id=user_id,
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def add_relations(self, user, author_ids):
+        created = Follow.objects.add_many(user, author_ids)
+        FeedEntry.objects.backfill_authors(user.id, created)
+        return created
+
+    def remove_relations(self, user, author_ids):
+        removed = Follow.objects.remove_many(user, author_ids)
+        FeedEntry.objects.remove_authors(user.id, removed)
+        return removed
 
 
 class FavoriteViewSet(
-    mixins.CreateModelMixin,
-    mixins.DestroyModelMixin,
-    viewsets.GenericViewSet
+    SerializeTimingMixin,
+    RelationToggleMixin,
+    viewsets.GenericViewSet,
 ):
     serializer_class = FavoriteSerializer
+    target_model = Recipe
+    target_url_kwarg = 'recipe_id'
+    already_added_message = 'Этот товар уже есть у вас в избранном!'
 
     def get_queryset(self):
         return Favorite.objects.filter(user=self.request.user)
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['recipe_id'] = self.kwargs.get('recipe_id')
-        return context
+    def add_relation(self, user, recipe):
+        return Favorite.objects.add(user, recipe)
 
-    def perform_create(self, serializer):
-        serializer.save(
-            user=self.request.user,
-            favorite_recipe=get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('recipe_id'),
-            )
-        )
+    def remove_relation(self, user, recipe_id):
+        return Favorite.objects.remove(user, recipe_id)
+
+    def build_relation(self, user, recipe):
+        return Favorite(user=user, favorite_recipe=recipe)
+
+
+class FavoriteBatchViewSet(RelationBatchMixin, viewsets.GenericViewSet):
+    serializer_class = RelationBatchSerializer
+    target_model = Recipe
 
-    @action(methods=['delete'], detail=True)
-    def delete(self, request, recipe_id):
-        get_object_or_404(
-            Favorite,
-            user=request.user,
-            favorite_recipe_id=recipe_id).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def add_relations(self, user, recipe_ids):
+        return Favorite.objects.add_many(user, recipe_ids)
+
+    def remove_relations(self, user, recipe_ids):
+        return Favorite.objects.remove_many(user, recipe_ids)
 
 
 class ShoppingCartCreateDestroyViewSet(
-    mixins.CreateModelMixin,
-    mixins.DestroyModelMixin,
+    SerializeTimingMixin,
+    RelationToggleMixin,
     viewsets.GenericViewSet,
 ):
     queryset = ShoppingCart.objects.all()
     serializer_class = ShoppingCartCreateDestroySerializer
+    target_model = Recipe
+    target_url_kwarg = 'recipe_id'
+    already_added_message = 'Этот товар уже есть в вашем списке покупок!'
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['recipe_id'] = self.kwargs.get('recipe_id')
-        return context
+    def add_relation(self, user, recipe):
+        return ShoppingCart.objects.add(user, recipe)
 
-    def perform_create(self, serializer):
-        serializer.save(
-            user=self.request.user,
-            recipe=get_object_or_404(Recipe, id=self.kwargs.get('recipe_id')),
-        )
+    def remove_relation(self, user, recipe_id):
+        return ShoppingCart.objects.remove(user, recipe_id)
+
+    def build_relation(self, user, recipe):
+        return ShoppingCart(user=user, recipe=recipe)
+
+
+class ShoppingCartBatchViewSet(RelationBatchMixin, viewsets.GenericViewSet):
+    serializer_class = RelationBatchSerializer
+    target_model = Recipe
+
+    def add_relations(self, user, recipe_ids):
+        return ShoppingCart.objects.add_many(user, recipe_ids)
 
-    @action(methods=['delete'], detail=True)
-    def delete(self, request, recipe_id):
-        get_object_or_404(
-            ShoppingCart,
-            user=request.user,
-            recipe_id=recipe_id,
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def remove_relations(self, user, recipe_ids):
+        return ShoppingCart.objects.remove_many(user, recipe_ids)
 
 
 class ShoppingCartDownloadAPIView(views.APIView):
+    content_negotiation_class = IgnoreFormatContentNegotiation
 
     def get_queryset(self):
         return ShoppingCart.objects.filter(user=self.request.user)
 
     def get(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__recipe_in_shopping_cart__user=request.user,
-        ).values(
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({
+                'format': f'Доступные форматы: {", ".join(EXPORT_FORMATS)}.'
+            })
+        content_type, export = EXPORT_FORMATS[file_format]
+        ingredients = request.user.shopping_list.values_list(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(
-            total_amount=Sum('amount')
-        )
-        shopping_list = ['Список покупок: \n\n']
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient["ingredient__name"]} '
-                f'({ingredient["ingredient__measurement_unit"]}) - '
-                f'{ingredient["total_amount"]}\n'
-            )
-        response = HttpResponse(shopping_list, content_type='text/plain')
+            'amount',
+        ).order_by('ingredient__name').iterator(
+            chunk_size=settings.SHOPPING_LIST_EXPORT_CHUNK_SIZE,
+        )
+        response = StreamingHttpResponse(
+            export(ingredients),
+            content_type=content_type,
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{file_format}"'
         )
         return response
+
+
+class AuthCacheStatsAPIView(views.APIView):
+    """
+    Счётчики кэша аутентификации воркера, который обработал запрос.
+    """
+    permission_classes = (AdminPermission,)
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+
+class RequestMetricsAPIView(views.APIView):
+    """
+    Перцентили замеров RequestMetricsMiddleware по маршрутам воркера,
+    который обработал запрос.
+    """
+    permission_classes = (AdminPermission,)
+
+    def get(self, request):
+        return Response(route_metrics.summary())
@@ -0,0 +1,293 @@
+import random
+from io import StringIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Max
+from recipes.models import (
+    Favorite, FeedEntry, Ingredient, IngredientRecipe, Recipe, RecipeSearch,
+    ShoppingCart, ShoppingListItem, Tag, TagRecipe
+)
+from rest_framework.authtoken.models import Token
+from users.models import Follow, User
+
+ADJECTIVES = (
+    'свежий', 'сушёный', 'копчёный', 'молотый', 'красный', 'зелёный',
+    'сладкий', 'острый', 'тёртый', 'солёный',
+)
+PRODUCTS = (
+    'картофель', 'морковь', 'лук', 'чеснок', 'томат', 'огурец', 'перец',
+    'капуста', 'свекла', 'яблоко', 'груша', 'рис', 'гречка', 'мука',
+    'сахар', 'соль', 'масло', 'молоко', 'сыр', 'творог', 'курица',
+    'говядина', 'свинина', 'рыба', 'лосось', 'укроп', 'петрушка',
+    'базилик', 'имбирь', 'лимон', 'апельсин', 'банан', 'клубника',
+    'малина', 'орех', 'мёд', 'шоколад', 'яйцо', 'фасоль', 'горох',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'рагу', 'запеканка', 'каша', 'соус', 'паста',
+    'омлет', 'десерт',
+)
+STYLES = (
+    'домашний', 'быстрый', 'праздничный', 'постный', 'летний', 'зимний',
+    'бабушкин', 'острый',
+)
+FILLER = (
+    'нарезать', 'обжарить', 'варить', 'добавить', 'перемешать', 'посолить',
+    'запекать', 'минут', 'до', 'готовности', 'на', 'среднем', 'огне',
+    'подавать', 'горячим', 'охладить', 'взбить', 'и', 'с',
+)
+TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'baking'),
+    ('Постное', 'lenten'),
+    ('Быстро', 'quick'),
+    ('Праздник', 'holiday'),
+)
+
+
+def zipf_weights(count, exponent=1.0):
+    """
+    Накопленные веса популярности 1/rank^exponent для random.choices:
+    немногие элементы встречаются часто, большинство - редко, как
+    авторы, теги и ингредиенты.
+    """
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+class Dataset:
+    """
+    Синтетические данные для сценариев: id созданных объектов
+    и токены пользователей.
+    """
+
+    def __init__(self):
+        self.user_ids = []
+        self.tokens = {}
+        self.author_ids = []
+        self.recipe_ids = []
+        self.recipes_by_author = {}
+        self.tag_ids = []
+        self.tag_slugs = []
+        self.ingredient_ids = []
+        self.ingredient_names = []
+        self.counts = {}
+
+
+class Generator:
+    """
+    Создаёт пользователей, подписки, рецепты с тегами и ингредиентами,
+    избранное и корзины с распределениями популярности, затем
+    пересчитывает денормализованные данные теми же методами, что
+    и команды rebuild_*. Данные создаются пачками, без сигналов.
+    """
+
+    def __init__(self, users, recipes, seed=0):
+        self.users = users
+        self.recipes = recipes
+        self.random = random.Random(seed)
+        self.batch_size = settings.RECIPE_SEARCH_BATCH_SIZE
+
+    def generate(self):
+        dataset = Dataset()
+        self.create_reference(dataset)
+        self.create_users(dataset)
+        self.create_recipes(dataset)
+        self.create_relations(dataset)
+        call_command('recount', stdout=StringIO())
+        RecipeSearch.objects.rebuild()
+        FeedEntry.objects.rebuild()
+        ShoppingListItem.objects.rebuild()
+        Recipe.objects.refresh_popularity()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        dataset.counts = {
+            'users': len(dataset.user_ids),
+            'recipes': len(dataset.recipe_ids),
+            'tag_links': TagRecipe.objects.count(),
+            'ingredient_links': IngredientRecipe.objects.count(),
+            'follows': Follow.objects.count(),
+            'favorites': Favorite.objects.count(),
+            'shopping_carts': ShoppingCart.objects.count(),
+        }
+        return dataset
+
+    def create_reference(self, dataset):
+        Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=f'bench {name}',
+                    slug=f'bench-{slug}',
+                    color='#000000',
+                )
+                for name, slug in TAGS
+            ],
+            ignore_conflicts=True,
+        )
+        dataset.tag_ids, dataset.tag_slugs = map(list, zip(
+            *Tag.objects.filter(slug__startswith='bench-').order_by(
+                'id',
+            ).values_list('id', 'slug')
+        ))
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=f'{adjective} {product}', measurement_unit='г')
+                for product in PRODUCTS
+                for adjective in ADJECTIVES
+            ],
+            ignore_conflicts=True,
+        )
+        names = [
+            f'{adjective} {product}'
+            for product in PRODUCTS
+            for adjective in ADJECTIVES
+        ]
+        ids = dict(Ingredient.objects.filter(name__in=names).values_list(
+            'name',
+            'id',
+        ))
+        dataset.ingredient_names = names
+        dataset.ingredient_ids = [ids[name] for name in names]
+
+    def create_users(self, dataset):
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        for start in range(0, self.users, self.batch_size):
+            User.objects.bulk_create(
+                User(
+                    username=f'bench_{number}',
+                    email=f'bench_{number}@example.com',
+                    first_name='Bench',
+                    last_name=f'User {number}',
+                    password='!',
+                )
+                for number in range(
+                    start,
+                    min(start + self.batch_size, self.users),
+                )
+            )
+        dataset.user_ids = list(User.objects.filter(
+            id__gt=last_id,
+        ).order_by('id').values_list('id', flat=True))
+        tokens = [
+            Token(key=Token.generate_key(), user_id=user_id)
+            for user_id in dataset.user_ids
+        ]
+        Token.objects.bulk_create(tokens, batch_size=self.batch_size)
+        dataset.tokens = {token.user_id: token.key for token in tokens}
+        # Пишет рецепты примерно каждый пятый пользователь.
+        dataset.author_ids = dataset.user_ids[::5]
+
+    def create_recipes(self, dataset):
+        choice = self.random.choice
+        words = PRODUCTS + DISHES + FILLER
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        authors = self.random.choices(
+            dataset.author_ids,
+            cum_weights=zipf_weights(len(dataset.author_ids)),
+            k=self.recipes,
+        )
+        for start in range(0, self.recipes, self.batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=author_id,
+                    name=(
+                        f'{choice(STYLES)} {choice(DISHES)} '
+                        f'{choice(PRODUCTS)} {start + number}'
+                    ),
+                    text=' '.join(
+                        choice(words)
+                        for _ in range(self.random.randint(20, 60))
+                    ),
+                    cooking_time=self.random.randint(5, 180),
+                    image='bench.png',
+                )
+                for number, author_id in enumerate(
+                    authors[start:start + self.batch_size],
+                )
+            )
+        recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id',
+        ).values_list('id', 'author_id'))
+        dataset.recipe_ids = [recipe_id for recipe_id, _ in recipes]
+        for recipe_id, author_id in recipes:
+            dataset.recipes_by_author.setdefault(author_id, []).append(
+                recipe_id,
+            )
+        tag_weights = zipf_weights(len(dataset.tag_ids), 0.7)
+        ingredient_weights = zipf_weights(len(dataset.ingredient_ids))
+        for start in range(0, len(dataset.recipe_ids), self.batch_size):
+            batch = dataset.recipe_ids[start:start + self.batch_size]
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in batch
+                for tag_id in self.sample(
+                    dataset.tag_ids,
+                    tag_weights,
+                    self.random.randint(1, 3),
+                )
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in batch
+                for ingredient_id in self.sample(
+                    dataset.ingredient_ids,
+                    ingredient_weights,
+                    self.random.randint(3, 12),
+                )
+            )
+
+    def create_relations(self, dataset):
+        author_weights = zipf_weights(len(dataset.author_ids))
+        recipe_weights = zipf_weights(len(dataset.recipe_ids), 0.8)
+        follows, favorites, carts = [], [], []
+        for user_id in dataset.user_ids:
+            follows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in self.sample(
+                    dataset.author_ids,
+                    author_weights,
+                    self.random.randint(0, 20),
+                )
+                if author_id != user_id
+            )
+            favorites.extend(
+                Favorite(user_id=user_id, favorite_recipe_id=recipe_id)
+                for recipe_id in self.sample(
+                    dataset.recipe_ids,
+                    recipe_weights,
+                    self.random.randint(0, 50),
+                )
+            )
+            carts.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.sample(
+                    dataset.recipe_ids,
+                    recipe_weights,
+                    self.random.randint(0, 10),
+                )
+            )
+        Follow.objects.bulk_create(follows, batch_size=self.batch_size)
+        Favorite.objects.bulk_create(favorites, batch_size=self.batch_size)
+        ShoppingCart.objects.bulk_create(carts, batch_size=self.batch_size)
+
+    def sample(self, population, weights, count):
+        """
+        До count разных элементов с вероятностью по накопленным весам.
+        """
+        if not count:
+            return []
+        return list(dict.fromkeys(self.random.choices(
+            population,
+            cum_weights=weights,
+            k=count,
+        )))
@@ -0,0 +1,115 @@
+import platform
+import random
+import subprocess
+import time
+
+import django
+from core.benchmark import percentile
+from core.middleware import RequestMetrics
+from django.conf import settings
+from django.db import connection
+from rest_framework.test import APIClient
+
+from .scenarios import SCENARIOS
+
+# Поля отчёта, которые сравниваются между коммитами.
+COMPARED = ('p50_ms', 'p99_ms', 'queries_per_request')
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    """
+    Выполняет сценарии последовательно одним клиентом через APIClient:
+    без сети и конкуренции, поэтому результаты зависят от кода
+    и базы, а не от нагрузки на машину, и сравнимы между коммитами.
+    """
+
+    def __init__(self, dataset, seed=0):
+        self.dataset = dataset
+        self.random = random.Random(seed)
+        self.client = APIClient()
+
+    def request(self, call):
+        headers = {}
+        if call.user_id is not None:
+            headers['HTTP_AUTHORIZATION'] = (
+                f'Token {self.dataset.tokens[call.user_id]}'
+            )
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            started = time.perf_counter()
+            send = getattr(self.client, call.method)
+            if call.data is None:
+                response = send(call.path, **headers)
+            else:
+                response = send(call.path, call.data, format='json', **headers)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            seconds = time.perf_counter() - started
+        return response, seconds, metrics.queries
+
+    def run(self, name, requests, warmup=0):
+        scenario = SCENARIOS[name]
+        for _ in range(warmup):
+            self.request(scenario(self.random, self.dataset))
+        timings, queries, errors = [], [], []
+        for _ in range(requests):
+            call = scenario(self.random, self.dataset)
+            response, seconds, count = self.request(call)
+            if response.status_code >= 400:
+                errors.append(
+                    f'{call.method.upper()} {call.path}: '
+                    f'{response.status_code}'
+                )
+            timings.append(seconds * 1000)
+            queries.append(count)
+        return {
+            'requests': requests,
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+            'throughput_rps': round(requests * 1000 / sum(timings), 1),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+        }
+
+
+def environment():
+    return {
+        'commit': current_commit(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+
+
+def compare(report, baseline):
+    """
+    Строки сравнения с отчётом baseline: значение было -> стало
+    и изменение в процентах для каждого поля COMPARED.
+    """
+    rows = []
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for field in COMPARED:
+            old, new = before[field], result[field]
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((name, field, old, new, change))
+    return rows
@@ -0,0 +1,134 @@
+from .data import DISHES, FILLER, PRODUCTS
+
+# PNG 1x1: картинка нового рецепта не должна влиять на замер.
+PIXEL_PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+class Call:
+    """
+    Один запрос сценария: пользователь (None - аноним), метод, путь
+    и тело в JSON.
+    """
+
+    def __init__(self, user_id, method, path, data=None):
+        self.user_id = user_id
+        self.method = method
+        self.path = path
+        self.data = data
+
+
+def maybe_anonymous(random, dataset):
+    if random.random() < 0.3:
+        return None
+    return random.choice(dataset.user_ids)
+
+
+def recipe_list(random, dataset):
+    user_id = maybe_anonymous(random, dataset)
+    query = random.choice((
+        lambda: '',
+        lambda: '&'.join(
+            f'tags={slug}'
+            for slug in random.sample(dataset.tag_slugs, random.randint(1, 2))
+        ),
+        lambda: f'author={random.choice(dataset.author_ids)}',
+        lambda: f'search={random.choice(PRODUCTS)}',
+        lambda: 'ordering=popular',
+        lambda: 'is_favorited=1' if user_id else '',
+        lambda: 'is_in_shopping_cart=1' if user_id else '',
+    ))()
+    # Дальше первой страницы листают только общий список: у фильтров
+    # страниц может не быть.
+    page = random.choice((1, 1, 2, 3)) if not query else 1
+    return Call(user_id, 'get', f'/api/recipes/?page={page}&{query}')
+
+
+def recipe_detail(random, dataset):
+    return Call(
+        maybe_anonymous(random, dataset),
+        'get',
+        f'/api/recipes/{random.choice(dataset.recipe_ids)}/',
+    )
+
+
+def subscriptions(random, dataset):
+    return Call(
+        random.choice(dataset.user_ids),
+        'get',
+        '/api/users/subscriptions/?recipes_limit=3',
+    )
+
+
+def ingredient_autocomplete(random, dataset):
+    name = random.choice(dataset.ingredient_names)
+    return Call(
+        None,
+        'get',
+        f'/api/ingredients/autocomplete/'
+        f'?name={name[:random.randint(2, 5)]}',
+    )
+
+
+def shopping_cart_download(random, dataset):
+    return Call(
+        random.choice(dataset.user_ids),
+        'get',
+        '/api/recipes/download_shopping_cart/?format=txt',
+    )
+
+
+def recipe_payload(random, dataset):
+    return {
+        'text': ' '.join(random.choices(PRODUCTS + DISHES + FILLER, k=40)),
+        'cooking_time': random.randint(5, 180),
+        'tags': random.sample(dataset.tag_ids, random.randint(1, 3)),
+        'ingredients': [
+            {'id': ingredient_id, 'amount': random.randint(1, 500)}
+            for ingredient_id in random.sample(
+                dataset.ingredient_ids,
+                random.randint(3, 12),
+            )
+        ],
+    }
+
+
+def recipe_create(random, dataset):
+    return Call(
+        random.choice(dataset.author_ids),
+        'post',
+        '/api/recipes/',
+        {
+            'name': f'{random.choice(DISHES)} {random.getrandbits(64):x}',
+            'image': PIXEL_PNG,
+            **recipe_payload(random, dataset),
+        },
+    )
+
+
+def recipe_update(random, dataset):
+    author_id = random.choice(list(dataset.recipes_by_author))
+    recipe_id = random.choice(dataset.recipes_by_author[author_id])
+    return Call(
+        author_id,
+        'patch',
+        f'/api/recipes/{recipe_id}/',
+        {
+            'name': f'{random.choice(DISHES)} {random.getrandbits(64):x}',
+            **recipe_payload(random, dataset),
+        },
+    )
+
+
+# сценарий: функция (random, dataset) -> Call
+SCENARIOS = {
+    'recipe_list': recipe_list,
+    'recipe_detail': recipe_detail,
+    'subscriptions': subscriptions,
+    'ingredient_autocomplete': ingredient_autocomplete,
+    'shopping_cart_download': shopping_cart_download,
+    'recipe_create': recipe_create,
+    'recipe_update': recipe_update,
+}
@@ -0,0 +1,19 @@
+import time
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[round(fraction * (len(values) - 1))]
+
+
+def measure(run, arguments):
+    """
+    Вызывает run для каждого аргумента и возвращает время вызовов
+    в миллисекундах и их результаты.
+    """
+    timings, results = [], []
+    for argument in arguments:
+        started = time.perf_counter()
+        results.append(run(argument))
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, results
@@ -0,0 +1,196 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Метка в общем кэше после инвалидации: пока она жива, значение
+# не кладётся в кэш запросом, который прочитал его из базы
+# до изменения.
+INVALIDATED = 'invalidated'
+
+
+class LRUCache:
+    """
+    Простой потокобезопасный LRU-кэш в памяти процесса.
+    С ttl записи старше ttl секунд считаются отсутствующими.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            expires, value = self._data[key]
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+local_cache = LRUCache(settings.REFERENCE_CACHE_LOCAL_SIZE)
+
+
+class VersionedCache:
+    """
+    Кэш справочных данных с версией.
+
+    Версия набора хранится в общем кэше Django и равна времени последнего
+    изменения в микросекундах, поэтому по ней же строятся ETag
+    и Last-Modified. Данные кэшируются под ключом с версией: в общем
+    кэше и в LRU каждого воркера. invalidate() выставляет новую версию,
+    и все воркеры перестают видеть старые данные.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+
+    @property
+    def version_key(self):
+        return f'reference:{self.name}:version'
+
+    def data_key(self, version):
+        return f'reference:{self.name}:{version}'
+
+    def version(self):
+        """
+        Текущая версия. Ключ версии кэш может вытеснить, несмотря
+        на timeout=None; тогда выставляется новая версия по времени,
+        что равносильно invalidate(): данные перечитаются, ETag сменится.
+        """
+        version = cache.get(self.version_key)
+        if version is not None:
+            return version
+        version = time.time_ns() // 1000
+        if cache.add(self.version_key, version, timeout=None):
+            return version
+        return cache.get(self.version_key, version)
+
+    def last_modified(self, version=None):
+        if version is None:
+            version = self.version()
+        return version // 10 ** 6
+
+    def etag(self, version=None):
+        if version is None:
+            version = self.version()
+        return f'"{self.name}-{version}"'
+
+    def get(self, version=None):
+        if version is None:
+            version = self.version()
+        key = self.data_key(version)
+        data = local_cache.get(key)
+        if data is None:
+            data = cache.get(key)
+            if data is None:
+                data = self.loader()
+                cache.set(key, data, timeout=settings.REFERENCE_CACHE_TIMEOUT)
+            local_cache.set(key, data)
+        return data
+
+    def invalidate(self):
+        version = max(
+            time.time_ns() // 1000,
+            (cache.get(self.version_key) or 0) + 1,
+        )
+        cache.set(self.version_key, version, timeout=None)
+
+
+class SortedIds:
+    """
+    Неизменяемое множество id на отсортированном массиве uint32:
+    4 байта на id в кэше, проверка вхождения двоичным поиском.
+    """
+    typecode = 'I'
+
+    def __init__(self, ids=()):
+        self.ids = array(self.typecode, sorted(set(ids)))
+
+    @classmethod
+    def frombytes(cls, data):
+        instance = cls()
+        instance.ids.frombytes(data)
+        return instance
+
+    def tobytes(self):
+        return self.ids.tobytes()
+
+    def __contains__(self, value):
+        index = bisect_left(self.ids, value)
+        return index < len(self.ids) and self.ids[index] == value
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class MembershipCache:
+    """
+    Кэш множества id, связанных с пользователем, например его избранного.
+
+    Множество хранится в общем кэше как SortedIds и загружается
+    запросом queryset(user_id) при промахе. Код, меняющий связи,
+    вызывает invalidate_on_commit(): после коммита вместо множества
+    ставится метка INVALIDATED, а загруженное множество кладётся через
+    cache.add. Так чтение, успевшее загрузить множество до коммита,
+    не перезапишет инвалидацию устаревшими данными; пока метка жива,
+    множество читается из базы при каждом запросе.
+    """
+
+    def __init__(self, name, queryset):
+        self.name = name
+        self.queryset = queryset
+
+    def key(self, user_id):
+        return f'membership:{self.name}:{user_id}'
+
+    def get(self, user_id):
+        data = cache.get(self.key(user_id))
+        if data is not None and data != INVALIDATED:
+            return SortedIds.frombytes(data)
+        ids = SortedIds(self.queryset(user_id))
+        cache.add(
+            self.key(user_id),
+            ids.tobytes(),
+            timeout=settings.MEMBERSHIP_CACHE_TIMEOUT,
+        )
+        return ids
+
+    def invalidate(self, user_id):
+        cache.set(
+            self.key(user_id),
+            INVALIDATED,
+            timeout=settings.MEMBERSHIP_CACHE_INVALIDATED_TIMEOUT,
+        )
+
+    def invalidate_on_commit(self, user_id):
+        transaction.on_commit(partial(self.invalidate, user_id))
@@ -0,0 +1,167 @@
+from django.db import connections, router
+from django.db.models import AutoField, Model
+
+INSERT_IGNORE_SQL = {
+    'mysql': 'INSERT IGNORE INTO {table} ({columns}) VALUES {rows}',
+}
+DEFAULT_INSERT_IGNORE_SQL = (
+    'INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT DO NOTHING'
+)
+
+
+def can_return_rows(connection):
+    """
+    Поддерживает ли база INSERT/DELETE ... RETURNING.
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def insert_ignore_sql(connection, model, rows):
+    """
+    SQL и параметры INSERT ... ON CONFLICT DO NOTHING для строк rows,
+    каждая из которых - словарь значений полей модели.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, AutoField)
+    ]
+    params = []
+    for values in rows:
+        instance = model(**values)
+        params.extend(
+            field.get_db_prep_save(
+                field.pre_save(instance, add=True),
+                connection=connection,
+            )
+            for field in fields
+        )
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = INSERT_IGNORE_SQL.get(
+        connection.vendor,
+        DEFAULT_INSERT_IGNORE_SQL,
+    ).format(
+        table=quote_name(model._meta.db_table),
+        columns=', '.join(quote_name(field.column) for field in fields),
+        rows=', '.join([placeholders] * len(rows)),
+    )
+    return sql, params
+
+
+def insert_ignore(model, **values):
+    """
+    Вставляет строку одной командой INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка вставлена, и False, если она нарушила
+    ограничение уникальности, то есть уже существовала. Сигналы
+    post_save при этом не отправляются.
+    """
+    connection = connections[router.db_for_write(model)]
+    sql, params = insert_ignore_sql(connection, model, [values])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def insert_ignore_many(model, rows, returning):
+    """
+    Вставляет пачку строк, пропуская уже существующие, и возвращает
+    значения поля returning у действительно вставленных строк.
+
+    Где есть RETURNING, это одна команда; иначе строки вставляются
+    по одной через insert_ignore.
+    """
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(model)]
+    if not can_return_rows(connection):
+        return [
+            values[returning] for values in rows
+            if insert_ignore(model, **values)
+        ]
+    sql, params = insert_ignore_sql(connection, model, rows)
+    column = model._meta.get_field(returning).column
+    sql += f' RETURNING {connection.ops.quote_name(column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def is_many(value):
+    return isinstance(value, (list, tuple, set))
+
+
+def delete_sql(connection, model, filters):
+    """
+    SQL и параметры DELETE строк модели, у которых поля filters равны
+    заданным значениям; для списка значений условие - IN.
+    """
+    quote_name = connection.ops.quote_name
+    conditions, params = [], []
+    for name, value in filters.items():
+        field = model._meta.get_field(name)
+        values = [
+            field.get_db_prep_value(
+                item.pk if isinstance(item, Model) else item,
+                connection=connection,
+            )
+            for item in (value if is_many(value) else [value])
+        ]
+        column = quote_name(field.column)
+        if is_many(value):
+            placeholders = ', '.join(['%s'] * len(values))
+            conditions.append(f'{column} IN ({placeholders})')
+        else:
+            conditions.append(f'{column} = %s')
+        params.extend(values)
+    sql = 'DELETE FROM {table} WHERE {conditions}'.format(
+        table=quote_name(model._meta.db_table),
+        conditions=' AND '.join(conditions),
+    )
+    return sql, params
+
+
+def delete_rows(model, **filters):
+    """
+    Удаляет строки модели с заданными значениями полей одной командой
+    DELETE и возвращает их число; значение может быть списком.
+
+    Связанные объекты не собираются и сигналы post_delete не
+    отправляются, поэтому подходит только для таблиц, на которые
+    никто не ссылается.
+    """
+    if any(is_many(value) and not value for value in filters.values()):
+        return 0
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        cursor.execute(*delete_sql(connection, model, filters))
+        return cursor.rowcount
+
+
+def delete_returning(model, returning, **filters):
+    """
+    Как delete_rows, но возвращает значения поля returning у удалённых
+    строк. Без поддержки RETURNING строки удаляются по одной.
+    """
+    if any(is_many(value) and not value for value in filters.values()):
+        return []
+    connection = connections[router.db_for_write(model)]
+    if not can_return_rows(connection):
+        candidates = model.objects.filter(**{
+            f'{name}__in' if is_many(value) else name: value
+            for name, value in filters.items()
+        }).values_list(returning, flat=True)
+        return [
+            value for value in candidates
+            if delete_rows(model, **{**filters, returning: value})
+        ]
+    sql, params = delete_sql(connection, model, filters)
+    column = model._meta.get_field(returning).column
+    sql += f' RETURNING {connection.ops.quote_name(column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
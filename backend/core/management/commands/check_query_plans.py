@@ -0,0 +1,113 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import (
+    Favorite, FeedEntry, IngredientRecipe, Recipe, ShoppingCart,
+    ShoppingListItem, TagRecipe
+)
+from users.models import Follow, User
+
+FULL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    # SCAN виртуальной таблицы FTS5 с MATCH идёт по её индексу.
+    'sqlite': re.compile(
+        r'\bSCAN (?:TABLE )?(\w+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)'
+    ),
+}
+
+
+def hot_queries():
+    """
+    Запросы, которые выполняются на каждой странице: проверки связей
+    пользователя с рецептом и автором, теги и ингредиенты рецептов,
+    лента, поиск и список покупок.
+    """
+    user = User(pk=1)
+    return (
+        ('favorite lookup', Favorite.objects.filter(
+            user_id=1,
+            favorite_recipe_id=1,
+        )),
+        ('shopping cart lookup', ShoppingCart.objects.filter(
+            user_id=1,
+            recipe_id=1,
+        )),
+        ('follow lookup', Follow.objects.filter(user_id=1, author_id=1)),
+        ('recipe tags', TagRecipe.objects.filter(recipe_id__in=(1, 2))),
+        ('recipes by tag', Recipe.objects.with_tags((1, 2)).order_by(
+            '-pub_date',
+            '-id',
+        )[:6]),
+        ('recipes by all tags', Recipe.objects.with_tags(
+            (1, 2),
+            match_all=True,
+        ).order_by('-pub_date', '-id')[:6]),
+        ('recipe ingredients', IngredientRecipe.objects.filter(
+            recipe_id__in=(1, 2),
+        )),
+        ('recipe page', Recipe.objects.annotate_user_flags(
+            user,
+        ).annotate_author_subscription(user)[:6]),
+        ('feed page', FeedEntry.objects.filter(user_id=1)[:6]),
+        ('recipe search', Recipe.objects.search('борщ').order_by(
+            '-search_rank',
+            '-id',
+        )[:6]),
+        ('shopping list', ShoppingListItem.objects.filter(user_id=1)),
+    )
+
+
+def query_plans():
+    """
+    Планы горячих запросов: (название, таблицы, прочитанные целиком,
+    план). None, если проверка для базы не поддерживается.
+    """
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        return None
+    tables = set(connection.introspection.table_names())
+    plans = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # На маленьких таблицах планировщик честно предпочитает
+            # полный просмотр; без него видно, есть ли подходящий индекс.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in hot_queries():
+            plan = queryset.explain()
+            scanned = sorted(
+                table for table in pattern.findall(plan)
+                if table in tables
+            )
+            plans.append((name, scanned, plan))
+    return plans
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN, что горячие запросы идут по индексам, '
+        'и завершается с ошибкой, если какой-то из них читает таблицу '
+        'целиком.'
+    )
+
+    def handle(self, *args, **options):
+        plans = query_plans()
+        if plans is None:
+            raise CommandError(
+                f'EXPLAIN check is not supported for {connection.vendor}'
+            )
+        failures = []
+        for name, scanned, plan in plans:
+            if scanned:
+                failures.append(name)
+                self.stdout.write(
+                    f'{name}: full scan of {", ".join(scanned)}\n{plan}'
+                )
+            else:
+                self.stdout.write(f'{name}: ok')
+        if failures:
+            raise CommandError(
+                f'{len(failures)} queries fall back to full scans'
+            )
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
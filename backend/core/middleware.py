@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .benchmark import percentile
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    'total_ms', 'db_ms', 'app_ms', 'serialize_ms', 'render_ms', 'queries',
+)
+
+
+class RequestMetrics:
+    """
+    Замеры одного запроса. Экземпляр - обёртка execute_wrapper:
+    считает запросы к базе и время их выполнения. Время сериализации
+    накапливает serializing() без запросов к базе внутри неё.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.view_finished = None
+        self.rendered = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @contextmanager
+    def serializing(self):
+        started = time.perf_counter()
+        db_time = self.db_time
+        try:
+            yield
+        finally:
+            self.serialize_time += (
+                time.perf_counter() - started - (self.db_time - db_time)
+            )
+
+    def finish_render(self, response):
+        self.rendered = time.perf_counter()
+
+    def as_dict(self):
+        finished = time.perf_counter()
+        total = finished - self.started
+        render = 0.0
+        if self.view_finished is not None and self.rendered is not None:
+            render = self.rendered - self.view_finished
+        app = total - self.db_time - self.serialize_time - render
+        return {
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'app_ms': round(app * 1000, 2),
+            'serialize_ms': round(self.serialize_time * 1000, 2),
+            'render_ms': round(render * 1000, 2),
+            'queries': self.queries,
+        }
+
+
+class RouteMetrics:
+    """
+    Последние REQUEST_METRICS_WINDOW замеров каждого маршрута в памяти
+    воркера и перцентили по ним.
+    """
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, values):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(
+                    maxlen=settings.REQUEST_METRICS_WINDOW,
+                )
+            samples.append(values)
+
+    def summary(self):
+        with self._lock:
+            samples = {
+                route: list(values)
+                for route, values in self._samples.items()
+            }
+        routes = {}
+        for route, values in sorted(samples.items()):
+            routes[route] = {'samples': len(values)}
+            for field in FIELDS:
+                column = [value[field] for value in values]
+                routes[route][field] = {
+                    'p50': percentile(column, 0.5),
+                    'p95': percentile(column, 0.95),
+                    'p99': percentile(column, 0.99),
+                }
+        return {
+            'pid': os.getpid(),
+            'sample_rate': settings.REQUEST_METRICS_SAMPLE_RATE,
+            'routes': routes,
+        }
+
+
+route_metrics = RouteMetrics()
+
+
+def request_route(request):
+    match = request.resolver_match
+    name = match.view_name if match is not None else 'unresolved'
+    return f'{request.method} {name}'
+
+
+def server_timing(values):
+    return ', '.join((
+        f'db;dur={values["db_ms"]};desc="{values["queries"]} queries"',
+        f'app;dur={values["app_ms"]}',
+        f'serialize;dur={values["serialize_ms"]}',
+        f'render;dur={values["render_ms"]}',
+        f'total;dur={values["total_ms"]}',
+    ))
+
+
+class RequestMetricsMiddleware:
+    """
+    Для доли запросов REQUEST_METRICS_SAMPLE_RATE замеряет число
+    запросов к базе и их время, время сериализации и рендеринга ответа
+    и общее время. Замеры уходят в заголовок Server-Timing, в журнал
+    одной строкой JSON и в перцентили маршрута, которые отдаёт
+    route_metrics. Остальные запросы проходят без обёрток.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        values = metrics.as_dict()
+        route = request_route(request)
+        response['Server-Timing'] = server_timing(values)
+        route_metrics.add(route, values)
+        logger.info(json.dumps({
+            'event': 'request',
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            **values,
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.view_finished = time.perf_counter()
+            response.add_post_render_callback(metrics.finish_render)
+        return response
@@ -0,0 +1,29 @@
+from django.db import connection
+from django.test import TestCase
+
+from .management.commands.check_query_plans import query_plans
+
+# Таблицы, которые читаются на каждой странице рецептов.
+INDEXED_TABLES = {
+    'recipes_recipe',
+    'recipes_favorite',
+    'recipes_shoppingcart',
+    'users_follow',
+}
+
+
+class QueryPlansTest(TestCase):
+    """
+    Горячие запросы не читают целиком таблицы рецептов и связей:
+    потерянный индекс роняет тест, а не только check_query_plans.
+    """
+
+    def test_no_full_scans(self):
+        plans = query_plans()
+        if plans is None:
+            self.skipTest(
+                f'EXPLAIN check is not supported for {connection.vendor}'
+            )
+        for name, scanned, plan in plans:
+            with self.subTest(query=name):
+                self.assertFalse(INDEXED_TABLES & set(scanned), plan)
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,9 +75,55 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default='5432'),
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
     }
 }
 
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.filebased.FileBasedCache',
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(BASE_DIR, 'cache'),
+        ),
+    }
+}
+
+# Файловый, локальный и табличный кэш по умолчанию держат 300 ключей
+# и при переполнении удаляют треть любых, а ключей здесь по два
+# на пользователя и по одному на токен. Memcached вытесняет сам.
+if 'memcached' not in CACHE_BACKEND:
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=100000)),
+    }
+
+REFERENCE_CACHE_TIMEOUT = 24 * 60 * 60
+
+REFERENCE_CACHE_LOCAL_SIZE = 8
+
+MEMBERSHIP_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Сколько секунд после изменения связей множество читается из базы,
+# а не из кэша. Чтение, которое загрузило множество до изменения,
+# а записывает его позже этого срока, вернёт в кэш устаревшие данные.
+MEMBERSHIP_CACHE_INVALIDATED_TIMEOUT = 10
+
+# Больше id не подставляются в запрос списком, а читаются подзапросом.
+MEMBERSHIP_INLINE_MAX_SIZE = 1000
+
+AUTH_TOKEN_CACHE_TIMEOUT = 5 * 60
+
+# Сколько секунд другие воркеры могут видеть отозванный токен или
+# прежние данные пользователя.
+AUTH_TOKEN_CACHE_LOCAL_TTL = 10
+
+AUTH_TOKEN_CACHE_LOCAL_SIZE = 10000
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,12 +162,108 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
 PAGINATION_PAGE_SIZE = 6
 
+PAGINATION_MAX_PAGE_SIZE = 200
+
+SHOPPING_LIST_EXPORT_CHUNK_SIZE = 2000
+
+FEED_BACKFILL_SIZE = 50
+
+FEED_BATCH_SIZE = 1000
+
+RELATION_BATCH_MAX_SIZE = 100
+
+POPULARITY_WINDOW_DAYS = 30
+
+POPULARITY_HALF_LIFE_HOURS = 72
+
+POPULARITY_BATCH_SIZE = 1000
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+
+RECIPE_SEARCH_MAX_WORDS = 8
+
+RECIPE_SEARCH_BATCH_SIZE = 500
+
+RECIPE_IMAGE_VARIANTS = {
+    'small': 320,
+    'medium': 960,
+}
+
+RECIPE_IMAGE_FORMATS = ('webp', 'jpeg')
+
+RECIPE_IMAGE_VARIANTS_DIR = 'recipes/variants'
+
+# thread - обрабатывать картинки в пуле потоков веб-процесса;
+# command - только воркером manage.py process_images.
+IMAGE_WORKER = os.getenv('IMAGE_WORKER', default='thread')
+
+IMAGE_WORKER_THREADS = 2
+
+IMAGE_WORKER_POLL_INTERVAL = 5
+
+IMAGE_JOB_TIMEOUT = 300
+
+IMAGE_JOB_MAX_ATTEMPTS = 3
+
+RECIPE_IMAGE_MAX_BYTES = int(os.getenv(
+    'RECIPE_IMAGE_MAX_BYTES',
+    default=10 * 1024 * 1024,
+))
+
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv(
+    'RECIPE_IMAGE_MAX_PIXELS',
+    default=40 * 1000 * 1000,
+))
+
+# base64 в JSON на треть длиннее файла; остальное - поля рецепта.
+RECIPE_JSON_MAX_BYTES = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Доля запросов, которые замеряет RequestMetricsMiddleware:
+# 0 - ни одного, 1 - все.
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv(
+    'REQUEST_METRICS_SAMPLE_RATE',
+    default=0.1,
+))
+
+# Сколько последних замеров маршрута хранится для перцентилей.
+REQUEST_METRICS_WINDOW = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'core.middleware': {
+            'handlers': ['metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'PERMISSIONS': {
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
+from . import images
 from .models import (
-    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+    Favorite, ImageJob, Ingredient, IngredientRecipe, Recipe, RecipeSearch,
+    ShoppingCart, ShoppingListItem, Tag, recipe_amounts
 )
 
 
@@ -11,15 +13,40 @@ class IngredientRecipeInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'recipe_in_favorites_count')
+    list_display = (
+        'name',
+        'author',
+        'favorites_count',
+        'shopping_cart_count',
+        'popularity',
+        'image_status',
+    )
     list_filter = ('name', 'author__username', 'tags__name')
     search_fields = ('name',)
+    readonly_fields = (
+        'favorites_count',
+        'shopping_cart_count',
+        'popularity',
+        'image_status',
+    )
     inlines = (IngredientRecipeInline,)
 
-    def recipe_in_favorites_count(self, recipe):
-        return Favorite.objects.filter(favorite_recipe=recipe).count()
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            images.enqueue(obj)
 
-    recipe_in_favorites_count.short_description = 'In favorites count'
+    def save_related(self, request, form, formsets, change):
+        # Дату изменения рецепта уже сдвинул save_model: админка сохраняет
+        # рецепт и тогда, когда в форме изменены только ингредиенты.
+        old_amounts = recipe_amounts(form.instance)
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(
+            form.instance,
+            old_amounts,
+            recipe_amounts(form.instance),
+        )
+        RecipeSearch.objects.refresh([form.instance.pk])
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -33,7 +60,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 class FavoriteAdmin(admin.ModelAdmin):
-    list_display = ('user', 'favorite_recipe')
+    list_display = ('user', 'favorite_recipe', 'pub_date')
     search_fields = ('user', 'favorite_recipe')
 
 
@@ -43,12 +70,63 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 
 
 class IngredientRecipeAdmin(admin.ModelAdmin):
+    """
+    Правки ингредиентов рецепта переносятся в списки покупок всех,
+    у кого рецепт в корзине, и сдвигают дату изменения рецепта.
+    """
     list_display = ('ingredient', 'recipe', 'amount')
 
+    @staticmethod
+    def unlist(queryset):
+        for recipe_id, ingredient_id, amount in queryset.values_list(
+            'recipe_id',
+            'ingredient_id',
+            'amount',
+        ):
+            ShoppingListItem.objects.change_recipe(
+                recipe_id,
+                {ingredient_id: amount},
+                {},
+            )
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            self.unlist(IngredientRecipe.objects.filter(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.change_recipe(
+            obj.recipe_id,
+            {},
+            {obj.ingredient_id: obj.amount},
+        )
+        Recipe.objects.filter(pk=obj.recipe_id).touch()
+
+    def delete_model(self, request, obj):
+        self.unlist(IngredientRecipe.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).touch()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        self.unlist(queryset)
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+
+
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    search_fields = ('user__username', 'ingredient__name')
+
+
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'status', 'attempts', 'created', 'finished')
+    list_filter = ('status',)
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(ImageJob, ImageJobAdmin)
@@ -0,0 +1,87 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from .cache import ingredients_cache
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия в нижнем регистре хранятся отсортированными: совпадения
+    по началу названия находятся бинарным поиском, а вхождения в середину
+    названия ищутся str.find по склеенной строке всех названий.
+    Индекс строится по данным ingredients_cache и перестраивается,
+    когда меняется версия кэша, то есть после изменения ингредиентов
+    в любом воркере.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = ([], [], '', [])
+
+    def build(self, version):
+        entries = sorted(
+            (item['name'].lower(), item['id'], item)
+            for item in ingredients_cache.get(version)
+        )
+        keys = [entry[0] for entry in entries]
+        offsets, position = [], 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+        items = [item for _, _, item in entries]
+        # Снимок заменяется одним присваиванием, чтобы параллельные
+        # запросы не видели наполовину перестроенный индекс.
+        self._snapshot = (keys, items, '\n'.join(keys), offsets)
+        self._version = version
+
+    def ensure_built(self):
+        version = ingredients_cache.version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self.build(version)
+
+    @staticmethod
+    def prefix_range(keys, query):
+        """
+        Границы ингредиентов, чьё название начинается с query.
+        """
+        start = bisect_left(keys, query)
+        end = bisect_right(keys, query + '\uffff', lo=start)
+        return start, end
+
+    def starts_with(self, query):
+        self.ensure_built()
+        keys, items, _, _ = self._snapshot
+        start, end = self.prefix_range(keys, query.strip().lower())
+        return items[start:end]
+
+    def search(self, query, limit):
+        """
+        Возвращает до limit ингредиентов: сначала те, чьё название
+        начинается с query, затем те, где query встречается внутри.
+        """
+        self.ensure_built()
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+        keys, items, text, offsets = self._snapshot
+        start, end = self.prefix_range(keys, query)
+        indexes = list(range(start, min(end, start + limit)))
+        # Если совпадений по началу хватило, склеенная строка
+        # не просматривается.
+        position = text.find(query) if len(indexes) < limit else -1
+        while position != -1 and len(indexes) < limit:
+            index = bisect_right(offsets, position) - 1
+            if position != offsets[index]:
+                indexes.append(index)
+            if index + 1 == len(offsets):
+                break
+            position = text.find(query, offsets[index + 1])
+        return [items[index] for index in indexes]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,36 @@
+from core.cache import VersionedCache, local_cache
+
+from .models import Ingredient, Tag
+
+
+def load_tags():
+    return list(
+        Tag.objects.values('id', 'name', 'color', 'slug').order_by('id')
+    )
+
+
+def load_ingredients():
+    return list(
+        Ingredient.objects.values(
+            'id', 'name', 'measurement_unit',
+        ).order_by('id')
+    )
+
+
+tags_cache = VersionedCache('tags', load_tags)
+ingredients_cache = VersionedCache('ingredients', load_ingredients)
+
+
+def tag_ids_by_slug(version=None):
+    """
+    {slug: id} всех тегов. Словарь строится один раз на версию
+    справочника и хранится в LRU воркера рядом с самими тегами.
+    """
+    if version is None:
+        version = tags_cache.version()
+    key = f'{tags_cache.data_key(version)}:ids_by_slug'
+    tag_ids = local_cache.get(key)
+    if tag_ids is None:
+        tag_ids = {tag['slug']: tag['id'] for tag in tags_cache.get(version)}
+        local_cache.set(key, tag_ids)
+    return tag_ids
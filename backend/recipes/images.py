@@ -0,0 +1,220 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import (
+    IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY, JOB_DONE, JOB_FAILED,
+    JOB_PENDING, JOB_STALE, ImageJob, Recipe
+)
+
+EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def variant_dir(recipe_id):
+    return f'{settings.RECIPE_IMAGE_VARIANTS_DIR}/{recipe_id}'
+
+
+def variant_name(recipe_id, image_name, variant, image_format):
+    """
+    Путь варианта в хранилище. В него входит имя оригинала, поэтому
+    после замены картинки у вариантов новые URL.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    extension = EXTENSIONS[image_format]
+    return f'{variant_dir(recipe_id)}/{stem}_{variant}.{extension}'
+
+
+def variant_urls(recipe):
+    """
+    {вариант: {формат: URL}} для обработанной картинки, иначе None.
+    """
+    if recipe.image_status != IMAGE_READY or not recipe.image:
+        return None
+    return {
+        variant: {
+            image_format: default_storage.url(variant_name(
+                recipe.pk,
+                recipe.image.name,
+                variant,
+                image_format,
+            ))
+            for image_format in settings.RECIPE_IMAGE_FORMATS
+        }
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def render_variants(file):
+    """
+    Уменьшает картинку до каждого размера из RECIPE_IMAGE_VARIANTS
+    и кодирует во все RECIPE_IMAGE_FORMATS: {(вариант, формат): байты}.
+    """
+    with Image.open(file) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    rendered = {}
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            buffer = BytesIO()
+            resized.save(
+                buffer,
+                format=image_format.upper(),
+                **SAVE_OPTIONS[image_format],
+            )
+            rendered[variant, image_format] = buffer.getvalue()
+    return rendered
+
+
+def save_variants(recipe_id, image_name, rendered):
+    names = set()
+    for (variant, image_format), content in rendered.items():
+        name = variant_name(recipe_id, image_name, variant, image_format)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(content))
+        names.add(name)
+    return names
+
+
+def delete_other_variants(recipe_id, names):
+    """
+    Удаляет варианты прежних картинок рецепта, кроме names.
+    """
+    directory = variant_dir(recipe_id)
+    _, files = default_storage.listdir(directory)
+    for file_name in files:
+        if f'{directory}/{file_name}' not in names:
+            default_storage.delete(f'{directory}/{file_name}')
+
+
+def process_job(job_id):
+    """
+    Обрабатывает одну задачу, если удалось её забрать. Картинка
+    помечается готовой, а варианты прежних картинок удаляются, только
+    если её не заменили во время обработки. Иначе задача устарела:
+    её варианты удаляются, а варианты новой картинки остаются.
+    """
+    if not ImageJob.objects.claim(job_id):
+        return False
+    job = ImageJob.objects.select_related('recipe').get(pk=job_id)
+    recipe = job.recipe
+    image_name = recipe.image.name
+    try:
+        with default_storage.open(image_name, 'rb') as file:
+            rendered = render_variants(file)
+        names = save_variants(recipe.pk, image_name, rendered)
+        recipe.refresh_from_db(fields=('image',))
+        if recipe.image.name != image_name:
+            for name in names:
+                default_storage.delete(name)
+            ImageJob.objects.filter(pk=job_id).update(
+                status=JOB_STALE,
+                error='',
+                finished=timezone.now(),
+            )
+            return True
+        delete_other_variants(recipe.pk, names)
+    except Exception as error:
+        final = job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS
+        ImageJob.objects.filter(pk=job_id).update(
+            status=JOB_FAILED if final else JOB_PENDING,
+            error=repr(error),
+            finished=timezone.now() if final else None,
+        )
+        if final:
+            Recipe.objects.filter(pk=recipe.pk, image=image_name).update(
+                image_status=IMAGE_FAILED,
+            )
+        return True
+    ImageJob.objects.filter(pk=job_id).update(
+        status=JOB_DONE,
+        error='',
+        finished=timezone.now(),
+    )
+    Recipe.objects.filter(pk=recipe.pk, image=image_name).update(
+        image_status=IMAGE_READY,
+    )
+    return True
+
+
+def process_pending(limit=None):
+    """
+    Обрабатывает задачи из очереди по порядку; возвращает их число.
+    """
+    ImageJob.objects.requeue_stale()
+    return sum(
+        process_job(job_id)
+        for job_id in ImageJob.objects.pending_ids(limit)
+    )
+
+
+class ImageWorkerPool:
+    """
+    Пул потоков веб-процесса для обработки картинок; создаётся
+    при первой задаче.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, job_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKER_THREADS,
+                    thread_name_prefix='recipe-images',
+                )
+        self._executor.submit(self.run, job_id)
+
+    @staticmethod
+    def run(job_id):
+        close_old_connections()
+        try:
+            # Неудачная попытка возвращает задачу в очередь,
+            # пока не исчерпан IMAGE_JOB_MAX_ATTEMPTS.
+            while process_job(job_id) and ImageJob.objects.filter(
+                pk=job_id,
+                status=JOB_PENDING,
+            ).exists():
+                pass
+        finally:
+            connection.close()
+
+
+worker_pool = ImageWorkerPool()
+
+
+def dispatch(job_id):
+    if settings.IMAGE_WORKER == 'thread':
+        worker_pool.submit(job_id)
+
+
+def enqueue(recipe):
+    """
+    Ставит картинку рецепта в очередь на обработку. В режиме thread
+    задача уходит в пул потоков после коммита транзакции; задачи,
+    которые не успели обработать, подберёт manage.py process_images.
+    """
+    Recipe.objects.filter(pk=recipe.pk).update(image_status=IMAGE_PENDING)
+    recipe.image_status = IMAGE_PENDING
+    job = ImageJob.objects.create(recipe=recipe)
+    transaction.on_commit(partial(dispatch, job.pk))
+    return job
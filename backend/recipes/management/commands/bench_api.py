@@ -0,0 +1,109 @@
+import json
+import tempfile
+import time
+
+from benchmarks.data import Generator
+from benchmarks.runner import Runner, compare, environment
+from benchmarks.scenarios import SCENARIOS
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API на синтетических данных: пользователи, '
+        'подписки, рецепты, избранное и корзины. Для каждого сценария '
+        'выводит пропускную способность, p50/p99 и число запросов к базе '
+        'на запрос; отчёт JSON можно сравнить с отчётом другого коммита. '
+        'Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=SCENARIOS,
+            default=list(SCENARIOS),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для отчёта JSON.')
+        parser.add_argument(
+            '--compare',
+            help='Отчёт JSON предыдущего прогона для сравнения.',
+        )
+
+    def handle(self, *args, **options):
+        # Отдельный кэш и каталог медиа: откаченные данные не должны
+        # остаться ни в общем кэше, ни на диске.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'bench_api',
+            }},
+            MEDIA_ROOT=media_root,
+            ALLOWED_HOSTS=['testserver'],
+            REQUEST_METRICS_SAMPLE_RATE=0,
+        ), transaction.atomic():
+            report = self.run(options)
+            transaction.set_rollback(True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.write_comparison(report, json.load(baseline))
+
+    def run(self, options):
+        started = time.perf_counter()
+        dataset = Generator(
+            options['users'],
+            options['recipes'],
+            options['seed'],
+        ).generate()
+        report = {
+            **environment(),
+            'seed': options['seed'],
+            'data': dataset.counts,
+            'generated_seconds': round(time.perf_counter() - started, 1),
+            'scenarios': {},
+        }
+        self.stdout.write(
+            f'{report["database"]} at {report["commit"]}: '
+            + ', '.join(
+                f'{count} {name}' for name, count in dataset.counts.items()
+            )
+            + f' generated in {report["generated_seconds"]} s'
+        )
+        self.stdout.write(
+            f'{"scenario":<24} {"rps":>7} {"p50 ms":>8} {"p99 ms":>8} '
+            f'{"queries":>7} {"errors":>6}'
+        )
+        runner = Runner(dataset, options['seed'])
+        for name in options['scenarios']:
+            result = runner.run(name, options['requests'], options['warmup'])
+            report['scenarios'][name] = result
+            self.stdout.write(
+                f'{name:<24} {result["throughput_rps"]:>7.1f} '
+                f'{result["p50_ms"]:>8.1f} {result["p99_ms"]:>8.1f} '
+                f'{result["queries_per_request"]:>7.1f} '
+                f'{result["errors"]:>6}'
+            )
+            if result['first_error']:
+                self.stderr.write(f'  {result["first_error"]}')
+        return report
+
+    def write_comparison(self, report, baseline):
+        self.stdout.write(
+            f'\nagainst {baseline.get("commit")} '
+            f'({baseline.get("database")}):'
+        )
+        for name, field, old, new, change in compare(report, baseline):
+            self.stdout.write(
+                f'{name:<24} {field:<20} {old:>9.2f} -> {new:>9.2f} '
+                f'{change:>+7.1f}%'
+            )
@@ -0,0 +1,115 @@
+import random
+import time
+
+from benchmarks.data import ADJECTIVES, PRODUCTS, STYLES
+from core.benchmark import measure, percentile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from recipes.autocomplete import ingredient_index
+from recipes.cache import ingredients_cache
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет автодополнение ингредиентов на синтетическом каталоге: '
+        'построение индекса в памяти, запросы по началу названия, '
+        'по вхождению и худший случай - полный просмотр без совпадений, '
+        'а для сравнения те же запросы к базе через istartswith '
+        'и icontains. Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument(
+            '--db-queries',
+            type=int,
+            default=20,
+            help='Сколько запросов выполнить к базе: они медленные.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bench_autocomplete',
+        }}), transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        started = time.perf_counter()
+        names = self.generate(options['ingredients'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f'{connection.vendor}: {Ingredient.objects.count()} ingredients '
+            f'generated in {time.perf_counter() - started:.1f} s'
+        )
+        ingredients_cache.invalidate()
+        started = time.perf_counter()
+        ingredient_index.ensure_built()
+        self.stdout.write(
+            f'index built in {time.perf_counter() - started:.2f} s'
+        )
+        limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        queries = {
+            'prefix': [
+                self.random.choice(names)[:self.random.randint(2, 6)]
+                for _ in range(options['queries'])
+            ],
+            'infix': [
+                self.random.choice(PRODUCTS)[:self.random.randint(3, 6)]
+                for _ in range(options['queries'])
+            ],
+            'miss': ['жжжщ'] * options['queries'],
+        }
+        self.stdout.write(
+            f'{"method":<8} {"query":<7} {"queries":>7} {"p50 ms":>8} '
+            f'{"p99 ms":>8} {"results":>8}'
+        )
+        for kind, terms in queries.items():
+            self.report(
+                'index',
+                kind,
+                terms,
+                lambda term: len(ingredient_index.search(term, limit)),
+            )
+        lookups = (('prefix', 'istartswith'), ('infix', 'icontains'))
+        for kind, lookup in lookups:
+            self.report(
+                'db',
+                kind,
+                queries[kind][:options['db_queries']],
+                lambda term: len(Ingredient.objects.filter(
+                    **{f'name__{lookup}': term},
+                ).order_by('name')[:limit]),
+            )
+
+    def generate(self, count):
+        names = list(dict.fromkeys(
+            f'{self.random.choice(STYLES)} {self.random.choice(ADJECTIVES)} '
+            f'{self.random.choice(PRODUCTS)} {number}'
+            for number in range(count)
+        ))
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit='г') for name in names),
+            batch_size=settings.RECIPE_SEARCH_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return names
+
+    def report(self, method, kind, terms, run):
+        if not terms:
+            return
+        timings, results = measure(run, terms)
+        self.stdout.write(
+            f'{method:<8} {kind:<7} {len(terms):>7} '
+            f'{percentile(timings, 0.5):>8.3f} '
+            f'{percentile(timings, 0.99):>8.3f} '
+            f'{sum(results) / len(results):>8.1f}'
+        )
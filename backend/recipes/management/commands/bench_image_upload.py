@@ -0,0 +1,232 @@
+import argparse
+import base64
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.test.utils import override_settings
+from PIL import Image
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+MB = 1024 * 1024
+BOUNDARY = 'foodgram-bench-boundary'
+
+
+def write_png(path, megabytes):
+    """
+    PNG из шума: почти не сжимается, поэтому весит около megabytes.
+    """
+    side = int(math.sqrt(megabytes * MB / 3))
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    image.save(path, 'PNG', compress_level=1)
+
+
+def write_json(path, image_path):
+    with open(path, 'wb') as body, open(image_path, 'rb') as image:
+        body.write(b'{"image": "data:image/png;base64,')
+        for chunk in iter(partial(image.read, 3 * 64 * 1024), b''):
+            body.write(base64.b64encode(chunk))
+        body.write(b'"}')
+
+
+def write_multipart(path, image_path):
+    with open(path, 'wb') as body, open(image_path, 'rb') as image:
+        body.write((
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="image"; '
+            'filename="bench.png"\r\n'
+            'Content-Type: image/png\r\n\r\n'
+        ).encode())
+        shutil.copyfileobj(image, body)
+        body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+
+
+def write_binary(path, image_path):
+    shutil.copyfile(image_path, path)
+
+
+# сценарий: (метод, путь, Content-Type, запись тела запроса)
+SCENARIOS = {
+    'json': (
+        'PATCH',
+        '/api/recipes/{id}/',
+        'application/json',
+        write_json,
+    ),
+    'multipart': (
+        'PUT',
+        '/api/recipes/{id}/image/',
+        f'multipart/form-data; boundary={BOUNDARY}',
+        write_multipart,
+    ),
+    'binary': (
+        'PUT',
+        '/api/recipes/{id}/image/',
+        'image/png',
+        write_binary,
+    ),
+}
+
+
+def peak_rss():
+    """
+    Пиковый RSS процесса в килобайтах (ru_maxrss в Linux).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пиковую память процесса на один запрос загрузки '
+        'картинки рецепта: base64 в JSON, multipart и тело image/*. '
+        'Каждый запрос выполняется в отдельном процессе через WSGI, '
+        'данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[1, 5, 20],
+            help='Размеры картинок в мегабайтах.',
+        )
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=SCENARIOS,
+            default=list(SCENARIOS),
+        )
+        parser.add_argument(
+            '--child',
+            nargs=2,
+            metavar=('SCENARIO', 'BODY'),
+            help=argparse.SUPPRESS,
+        )
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.run_request(*options['child'])))
+            return
+        self.stdout.write(
+            f'{"scenario":<10} {"image MB":>8} {"body MB":>8} '
+            f'{"status":>6} {"ms":>7} {"peak RSS MB":>11}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for megabytes in options['sizes']:
+                image_path = os.path.join(directory, f'{megabytes}.png')
+                write_png(image_path, megabytes)
+                for scenario in options['scenarios']:
+                    body_path = os.path.join(directory, scenario)
+                    SCENARIOS[scenario][3](body_path, image_path)
+                    result = self.spawn(scenario, body_path)
+                    self.stdout.write(
+                        f'{scenario:<10} '
+                        f'{os.path.getsize(image_path) / MB:>8.1f} '
+                        f'{os.path.getsize(body_path) / MB:>8.1f} '
+                        f'{result["status"]:>6} '
+                        f'{result["seconds"] * 1000:>7.0f} '
+                        f'{result["peak_rss_kb"] / 1024:>11.1f}'
+                    )
+
+    def spawn(self, scenario, body_path):
+        process = subprocess.run(
+            [
+                sys.executable,
+                os.path.join(settings.BASE_DIR, 'manage.py'),
+                'bench_image_upload',
+                '--child',
+                scenario,
+                body_path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr)
+        return json.loads(process.stdout.splitlines()[-1])
+
+    def run_request(self, scenario, body_path):
+        """
+        Выполняет один запрос и возвращает, на сколько он поднял пиковый
+        RSS процесса. Тело читается из файла, как из сокета.
+        """
+        method, path, content_type, _ = SCENARIOS[scenario]
+        body_size = os.path.getsize(body_path)
+        # Как тестовый клиент: иначе начало запроса закроет соединение
+        # вместе с открытой транзакцией.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        handler = WSGIHandler()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            ALLOWED_HOSTS=['testserver'],
+            RECIPE_IMAGE_MAX_BYTES=2 * body_size,
+            RECIPE_JSON_MAX_BYTES=2 * body_size,
+        ), transaction.atomic():
+            user = User.objects.create(
+                username='bench_image_upload',
+                email='bench_image_upload@example.com',
+            )
+            recipe = Recipe.objects.create(
+                author=user,
+                name='bench',
+                text='bench',
+                cooking_time=1,
+                image='bench.png',
+            )
+            token = Token.objects.create(user=user)
+            statuses = []
+            with open(body_path, 'rb') as body:
+                environ = {
+                    'REQUEST_METHOD': method,
+                    'PATH_INFO': path.format(id=recipe.pk),
+                    'SCRIPT_NAME': '',
+                    'QUERY_STRING': '',
+                    'SERVER_NAME': 'testserver',
+                    'SERVER_PORT': '80',
+                    'SERVER_PROTOCOL': 'HTTP/1.1',
+                    'CONTENT_TYPE': content_type,
+                    'CONTENT_LENGTH': str(body_size),
+                    'HTTP_AUTHORIZATION': f'Token {token.key}',
+                    'wsgi.input': body,
+                    'wsgi.errors': sys.stderr,
+                    'wsgi.url_scheme': 'http',
+                    'wsgi.version': (1, 0),
+                    'wsgi.multithread': False,
+                    'wsgi.multiprocess': True,
+                    'wsgi.run_once': False,
+                }
+                baseline = peak_rss()
+                started = time.perf_counter()
+                response = handler(
+                    environ,
+                    lambda status, headers, exc_info=None: statuses.append(
+                        int(status.split()[0]),
+                    ),
+                )
+                for _ in response:
+                    pass
+                response.close()
+                seconds = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return {
+            'status': statuses[0],
+            'seconds': seconds,
+            'peak_rss_kb': peak_rss() - baseline,
+        }
@@ -0,0 +1,154 @@
+import random
+import time
+
+from benchmarks.data import ADJECTIVES, DISHES, FILLER, PRODUCTS, STYLES
+from core.benchmark import measure, percentile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from recipes.models import Ingredient, IngredientRecipe, Recipe, RecipeSearch
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет полнотекстовый поиск рецептов на синтетических данных '
+        'против поиска через icontains. Данные создаются в транзакции '
+        'и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument(
+            '--scan-queries',
+            type=int,
+            default=5,
+            help='Сколько запросов выполнить без индекса: они медленные.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.generate(options['recipes'])
+            generated = time.perf_counter() - started
+            started = time.perf_counter()
+            documents = RecipeSearch.objects.rebuild()
+            indexed = time.perf_counter() - started
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(
+                f'{connection.vendor}: {options["recipes"]} recipes '
+                f'generated in {generated:.1f} s, {documents} documents '
+                f'indexed in {indexed:.1f} s'
+            )
+            terms = [self.search_term() for _ in range(options['queries'])]
+            self.stdout.write(
+                f'{"method":<8} {"queries":>7} {"p50 ms":>8} '
+                f'{"p99 ms":>8} {"matches":>9}'
+            )
+            self.report('index', terms, self.search_page)
+            self.report(
+                'scan',
+                terms[:options['scan_queries']],
+                self.scan_page,
+            )
+            transaction.set_rollback(True)
+
+    def generate(self, count):
+        author = User.objects.create(
+            username='bench_search',
+            email='bench_search@example.com',
+        )
+        ingredients = [
+            Ingredient(name=f'{adjective} {product}', measurement_unit='г')
+            for adjective in ADJECTIVES
+            for product in PRODUCTS
+        ]
+        Ingredient.objects.bulk_create(ingredients, ignore_conflicts=True)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        size = settings.RECIPE_SEARCH_BATCH_SIZE
+        last_id = 0
+        for start in range(0, count, size):
+            Recipe.objects.bulk_create(
+                self.recipe(author)
+                for _ in range(min(size, count - start))
+            )
+            recipe_ids = list(Recipe.objects.filter(
+                author=author,
+                id__gt=last_id,
+            ).order_by('id').values_list('id', flat=True))
+            last_id = recipe_ids[-1]
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in self.random.sample(
+                    ingredient_ids,
+                    self.random.randint(3, 8),
+                )
+            )
+
+    def recipe(self, author):
+        choice = self.random.choice
+        words = PRODUCTS + DISHES + FILLER
+        return Recipe(
+            author=author,
+            name=f'{choice(STYLES)} {choice(DISHES)} {choice(PRODUCTS)}',
+            text=' '.join(
+                choice(words) for _ in range(self.random.randint(20, 60))
+            ),
+            cooking_time=self.random.randint(5, 180),
+            image='bench.png',
+        )
+
+    def search_term(self):
+        choice = self.random.choice
+        return choice((
+            lambda: choice(PRODUCTS)[:5],
+            lambda: f'{choice(DISHES)} {choice(PRODUCTS)}',
+            lambda: f'{choice(STYLES)} {choice(DISHES)} {choice(PRODUCTS)}',
+        ))()
+
+    @staticmethod
+    def search_page(term):
+        """
+        Первая страница выдачи и COUNT, как в RecipeViewSet.list.
+        """
+        queryset = Recipe.objects.search(term)
+        list(queryset.order_by('-search_rank', '-id')[
+            :settings.PAGINATION_PAGE_SIZE
+        ])
+        return queryset.count()
+
+    @staticmethod
+    def scan_page(term):
+        condition = Q()
+        for word in term.split():
+            condition &= (
+                Q(name__icontains=word)
+                | Q(text__icontains=word)
+                | Q(ingredients__name__icontains=word)
+            )
+        queryset = Recipe.objects.filter(condition).distinct()
+        list(queryset.order_by('-pub_date', '-id')[
+            :settings.PAGINATION_PAGE_SIZE
+        ])
+        return queryset.count()
+
+    def report(self, method, terms, run):
+        if not terms:
+            return
+        timings, matches = measure(run, terms)
+        self.stdout.write(
+            f'{method:<8} {len(terms):>7} '
+            f'{percentile(timings, 0.5):>8.1f} '
+            f'{percentile(timings, 0.99):>8.1f} '
+            f'{sum(matches) / len(matches):>9.0f}'
+        )
@@ -0,0 +1,191 @@
+import random
+import time
+import tracemalloc
+
+from api.exporters import EXPORT_FORMATS
+from core.benchmark import percentile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import override_settings
+from recipes.models import (
+    Ingredient, IngredientRecipe, Recipe, ShoppingCart, ShoppingListItem
+)
+from rest_framework.test import APIClient
+from users.models import User
+
+KB = 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет выгрузку списка покупок при разном числе рецептов '
+        'в корзине: время до первого куска ответа (TTFB), полное время '
+        'и пиковую память Python на запрос для каждого формата. Данные '
+        'создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--carts',
+            type=int,
+            nargs='+',
+            default=[10, 1000, 10000],
+            help='Размеры корзин в рецептах.',
+        )
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--formats',
+            nargs='+',
+            choices=EXPORT_FORMATS,
+            default=list(EXPORT_FORMATS),
+        )
+        parser.add_argument('--requests', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = settings.RECIPE_SEARCH_BATCH_SIZE
+        with override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'bench_shopping_list',
+            }},
+            ALLOWED_HOSTS=['testserver'],
+            REQUEST_METRICS_SAMPLE_RATE=0,
+        ), transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        started = time.perf_counter()
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        recipe_ids = self.create_recipes(max(options['carts']), ingredient_ids)
+        users = {
+            size: self.create_cart(size, recipe_ids)
+            for size in options['carts']
+        }
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f'{connection.vendor}: {len(recipe_ids)} recipes, '
+            f'{len(ingredient_ids)} ingredients generated in '
+            f'{time.perf_counter() - started:.1f} s'
+        )
+        self.stdout.write(
+            f'{"recipes":>7} {"items":>6} {"format":<6} {"ttfb ms":>8} '
+            f'{"total ms":>9} {"peak KB":>8} {"size KB":>8}'
+        )
+        client = APIClient()
+        for size, user in users.items():
+            client.force_authenticate(user)
+            items = ShoppingListItem.objects.filter(user=user).count()
+            for file_format in options['formats']:
+                path = (
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={file_format}'
+                )
+                ttfb, total = [], []
+                for _ in range(options['requests']):
+                    first, last, length = self.download(client, path)
+                    ttfb.append(first)
+                    total.append(last)
+                # Трассировка памяти замедляет запрос, поэтому пик
+                # меряется отдельным запросом.
+                tracemalloc.start()
+                self.download(client, path)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'{size:>7} {items:>6} {file_format:<6} '
+                    f'{percentile(ttfb, 0.5):>8.1f} '
+                    f'{percentile(total, 0.5):>9.1f} '
+                    f'{peak / KB:>8.0f} {length / KB:>8.0f}'
+                )
+
+    @staticmethod
+    def download(client, path):
+        """
+        Время до первого куска и до конца ответа в миллисекундах
+        и длина ответа в байтах.
+        """
+        started = time.perf_counter()
+        response = client.get(path)
+        content = iter(response.streaming_content)
+        length = len(next(content, b''))
+        first = time.perf_counter() - started
+        for chunk in content:
+            length += len(chunk)
+        last = time.perf_counter() - started
+        return first * 1000, last * 1000, length
+
+    def create_ingredients(self, count):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(
+                    name=f'bench ingredient {number}',
+                    measurement_unit='г',
+                )
+                for number in range(count)
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        return list(Ingredient.objects.filter(
+            name__startswith='bench ingredient ',
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, ingredient_ids):
+        author = User.objects.create(
+            username='bench_shopping_list',
+            email='bench_shopping_list@example.com',
+        )
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        for start in range(0, count, self.batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f'bench recipe {number}',
+                    text='bench',
+                    cooking_time=10,
+                    image='bench.png',
+                )
+                for number in range(start, min(start + self.batch_size, count))
+            )
+        recipe_ids = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id',
+        ).values_list('id', flat=True))
+        for start in range(0, len(recipe_ids), self.batch_size):
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in recipe_ids[start:start + self.batch_size]
+                for ingredient_id in self.random.sample(
+                    ingredient_ids,
+                    self.random.randint(3, 12),
+                )
+            )
+        return recipe_ids
+
+    def create_cart(self, size, recipe_ids):
+        """
+        Пользователь с size рецептами в корзине; список покупок
+        пересчитывается так же, как командой rebuild_shopping_lists.
+        """
+        user = User.objects.create(
+            username=f'bench_shopping_list_{size}',
+            email=f'bench_shopping_list_{size}@example.com',
+        )
+        ShoppingCart.objects.bulk_create(
+            (
+                ShoppingCart(user=user, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(recipe_ids, size)
+            ),
+            batch_size=self.batch_size,
+        )
+        ShoppingListItem.objects.rebuild([user.id])
+        return user
@@ -0,0 +1,145 @@
+import random
+import time
+
+from core.benchmark import measure, percentile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from recipes.models import Recipe, Tag, TagRecipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет фильтр рецептов по тегам: прежнее соединение через '
+        'tags__slug с DISTINCT против полусоединений EXISTS. Данные '
+        'создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=250000,
+            help='При 1-7 тегах на рецепт это около 1 млн связей.',
+        )
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            started = time.perf_counter()
+            tag_ids = self.generate(options['recipes'], options['tags'])
+            generated = time.perf_counter() - started
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(
+                f'{connection.vendor}: {options["recipes"]} recipes, '
+                f'{TagRecipe.objects.count()} tag links '
+                f'generated in {generated:.1f} s'
+            )
+            self.stdout.write(
+                f'{"method":<11} {"tags":>4} {"queries":>7} {"p50 ms":>8} '
+                f'{"p99 ms":>8} {"matches":>9}'
+            )
+            slugs = dict(Tag.objects.filter(
+                id__in=tag_ids,
+            ).values_list('id', 'slug'))
+            for size in (1, 2, 3):
+                tag_sets = [
+                    self.random.sample(tag_ids, size)
+                    for _ in range(options['queries'])
+                ]
+                joined = self.report('join', tag_sets, lambda ids: (
+                    self.join_page([slugs[tag_id] for tag_id in ids])
+                ))
+                exists = self.report('exists any', tag_sets, self.any_page)
+                if joined != exists:
+                    raise CommandError(
+                        f'Фильтры нашли разное число рецептов: '
+                        f'{joined} и {exists}.'
+                    )
+                self.report('exists all', tag_sets, self.all_page)
+            transaction.set_rollback(True)
+
+    def generate(self, count, tags):
+        author = User.objects.create(
+            username='bench_tag_filter',
+            email='bench_tag_filter@example.com',
+        )
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'bench {number}',
+                slug=f'bench-{number}',
+                color='#000000',
+            )
+            for number in range(tags)
+        )
+        tag_ids = list(Tag.objects.filter(
+            slug__startswith='bench-',
+        ).values_list('id', flat=True))
+        size = settings.RECIPE_SEARCH_BATCH_SIZE
+        last_id = 0
+        for start in range(0, count, size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name='bench',
+                    text='bench',
+                    cooking_time=1,
+                    image='bench.png',
+                )
+                for _ in range(min(size, count - start))
+            )
+            recipe_ids = list(Recipe.objects.filter(
+                author=author,
+                id__gt=last_id,
+            ).order_by('id').values_list('id', flat=True))
+            last_id = recipe_ids[-1]
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.random.sample(
+                    tag_ids,
+                    self.random.randint(1, min(7, tags)),
+                )
+            )
+        return tag_ids
+
+    @staticmethod
+    def first_page(queryset):
+        """
+        Первая страница выдачи и COUNT, как в RecipeViewSet.list.
+        """
+        list(queryset.order_by('-pub_date', '-id')[
+            :settings.PAGINATION_PAGE_SIZE
+        ])
+        return queryset.count()
+
+    def join_page(self, slugs):
+        # Прежний MultipleChoiceFilter по tags__slug.
+        condition = Q()
+        for slug in slugs:
+            condition |= Q(tags__slug=slug)
+        return self.first_page(Recipe.objects.filter(condition).distinct())
+
+    def any_page(self, tag_ids):
+        return self.first_page(Recipe.objects.with_tags(tag_ids))
+
+    def all_page(self, tag_ids):
+        return self.first_page(
+            Recipe.objects.with_tags(tag_ids, match_all=True),
+        )
+
+    def report(self, method, tag_sets, run):
+        timings, matches = measure(run, tag_sets)
+        self.stdout.write(
+            f'{method:<11} {len(tag_sets[0]):>4} {len(tag_sets):>7} '
+            f'{percentile(timings, 0.5):>8.1f} '
+            f'{percentile(timings, 0.99):>8.1f} '
+            f'{sum(matches) / len(matches):>9.0f}'
+        )
+        return matches
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.images import process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает очередь картинок рецептов: строит уменьшенные '
+        'копии в WebP и JPEG. С --loop работает как постоянный воркер.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Не завершаться, а опрашивать очередь.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Сколько задач обработать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending(options['limit'])
+            if processed or not options['loop']:
+                self.stdout.write(f'Processed {processed} image jobs')
+            if not options['loop']:
+                return
+            if not processed:
+                time.sleep(settings.IMAGE_WORKER_POLL_INTERVAL)
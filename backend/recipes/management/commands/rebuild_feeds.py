@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из текущих подписок и рецептов.'
+
+    def handle(self, *args, **options):
+        FeedEntry.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Feeds rebuilt: {FeedEntry.objects.count()} entries'
+        ))
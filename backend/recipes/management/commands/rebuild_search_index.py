@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes.models import RecipeSearch
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает поисковые документы рецептов: название, '
+        'ингредиенты и описание.'
+    )
+
+    def handle(self, *args, **options):
+        documents = RecipeSearch.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Search index rebuilt: {documents} recipes'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает сводные списки покупок по корзинам пользователей '
+        'или сверяет их с актуальной агрегацией (--verify).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить списки, ничего не изменяя.',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='id пользователя; можно указать несколько раз.',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['verify']:
+            ShoppingListItem.objects.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS('Shopping lists rebuilt'))
+            return
+        live = ShoppingListItem.objects.live_totals(user_ids)
+        stored = ShoppingListItem.objects.stored_totals(user_ids)
+        mismatches = sorted(
+            key for key in set(live) | set(stored)
+            if live.get(key) != stored.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'stored {stored.get((user_id, ingredient_id), 0)}, '
+                f'expected {live.get((user_id, ingredient_id), 0)}'
+            )
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} shopping list rows are out of date'
+            )
+        self.stdout.write(self.style.SUCCESS('Shopping lists are up to date'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# (модель, поле-счётчик, модель связей, внешний ключ на модель)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'favorite_recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def actual_count(related_model, field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{field: OuterRef('pk')},
+            ).order_by().values(field).annotate(
+                count=Count('id'),
+            ).values('count'),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики рецептов и пользователей '
+        'с фактическим числом связей и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, field in COUNTERS:
+            with transaction.atomic():
+                drifted = model.objects.annotate(
+                    actual=actual_count(related_model, field),
+                ).exclude(**{counter: F('actual')})
+                drifted_ids = list(drifted.values_list('pk', flat=True))
+                if drifted_ids and not options['dry_run']:
+                    model.objects.filter(pk__in=drifted_ids).update(
+                        **{counter: actual_count(related_model, field)},
+                    )
+            prefix = '[dry run] ' if options['dry_run'] else ''
+            self.stdout.write(
+                f'{prefix}{model._meta.label}.{counter}: '
+                f'{len(drifted_ids)} rows out of date'
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярности рецептов по свежему избранному. '
+        'Запускается периодически, например из cron.'
+    )
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.refresh_popularity()
+        self.stdout.write(self.style.SUCCESS(
+            f'Popularity refreshed: {updated} recipes updated'
+        ))
@@ -1,30 +1,124 @@
 import csv
+import json
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.cache import ingredients_cache
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, '../data/ingredients.csv')
+DEFAULT_CHUNK_SIZE = 5000
+CSV_HEADER = ['name', 'measurement_unit']
+
+
+def read_csv(file):
+    data = csv.reader(file)
+    for row in data:
+        if row == CSV_HEADER:
+            continue
+        yield row
 
-def load_ingredients(name, measurement_unit):
-    Ingredient.objects.get_or_create(
-        name=name,
-        measurement_unit=measurement_unit,
-    )
 
+def read_json(file):
+    """
+    Читает как фикстуру Django (ingredients.json), так и простой
+    список объектов с полями name и measurement_unit.
+    """
+    for item in json.load(file):
+        fields = item.get('fields', item)
+        yield fields.get('name'), fields.get('measurement_unit')
 
-filename_func_names = {
-    'ingredients.csv': load_ingredients,
+
+readers = {
+    '.csv': read_csv,
+    '.json': read_json,
 }
 
 
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
-        for filename, func in filename_func_names.items():
-            path = os.path.join(settings.BASE_DIR, '../data/') + filename
+    help = (
+        'Загружает ингредиенты из CSV или JSON пачками. '
+        'Повторный запуск не создаёт дубликатов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=[DEFAULT_PATH],
+            help='Файлы .csv или .json; по умолчанию data/ingredients.csv.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Сколько строк вставлять за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать строки, ничего не записывая.',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        seen = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        for path in options['paths']:
+            reader = readers.get(os.path.splitext(path)[1].lower())
+            if reader is None:
+                raise CommandError(f'Unsupported file type: {path}')
             with open(path, 'r', encoding='utf-8') as file:
-                data = csv.reader(file)
-                next(data)
-                for name, measurement_unit in data:
-                    func(name, measurement_unit)
-                print(f'Added {filename}')
+                inserted, skipped = self.load(
+                    reader(file),
+                    seen,
+                    options['chunk_size'],
+                    options['dry_run'],
+                )
+            prefix = '[dry run] ' if options['dry_run'] else ''
+            self.stdout.write(
+                f'{prefix}{os.path.basename(path)}: '
+                f'inserted {inserted}, skipped {skipped}'
+            )
+            if inserted and not options['dry_run']:
+                ingredients_cache.invalidate()
+
+    def load(self, rows, seen, chunk_size, dry_run):
+        """
+        Отбрасывает пустые строки и уже известные пары
+        (название, единица измерения), остальное вставляет bulk_create.
+        """
+        inserted = skipped = 0
+        for chunk in chunks(rows, chunk_size):
+            new_ingredients = []
+            for row in chunk:
+                if len(row) != 2 or not all(row):
+                    skipped += 1
+                    continue
+                key = (row[0].strip(), row[1].strip())
+                if not all(key) or key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+                new_ingredients.append(
+                    Ingredient(name=key[0], measurement_unit=key[1])
+                )
+            if not dry_run:
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(new_ingredients)
+            inserted += len(new_ingredients)
+        return inserted, skipped
@@ -0,0 +1,117 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def duplicates(model, fields):
+    """
+    Группы строк с одинаковыми fields: (значения, id строк).
+    """
+    rows = {}
+    for row in model.objects.order_by('id').values('id', *fields):
+        key = tuple(row[field] for field in fields)
+        rows.setdefault(key, []).append(row['id'])
+    return [(key, ids) for key, ids in rows.items() if len(ids) > 1]
+
+
+def count_related(model, field):
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(
+                **{field: models.OuterRef('pk')},
+            ).order_by().values(field).annotate(
+                count=models.Count('id'),
+            ).values('count'),
+        ),
+        0,
+    )
+
+
+def rebuild_shopping_lists(apps, user_ids):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    totals = IngredientRecipe.objects.filter(
+        recipe__recipe_in_shopping_cart__user__in=user_ids,
+    ).values_list(
+        'recipe__recipe_in_shopping_cart__user',
+        'ingredient',
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            amount=total,
+        )
+        for user_id, ingredient_id, total in totals
+    )
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Оставляет первую из повторяющихся строк; количества повторяющихся
+    ингредиентов рецепта складываются, как и при сборке списка покупок.
+
+    Счётчики рецептов (0006) и списки покупок (0003) посчитаны
+    до удаления повторов, поэтому для затронутых рецептов
+    и пользователей они пересчитываются.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    for _, ids in duplicates(TagRecipe, ('recipe_id', 'tag_id')):
+        TagRecipe.objects.filter(id__in=ids[1:]).delete()
+    counters = (
+        (Favorite, 'favorite_recipe', 'favorites_count'),
+        (ShoppingCart, 'recipe', 'shopping_cart_count'),
+    )
+    for model, field, counter in counters:
+        groups = duplicates(model, ('user_id', f'{field}_id'))
+        for _, ids in groups:
+            model.objects.filter(id__in=ids[1:]).delete()
+        Recipe.objects.filter(
+            id__in={recipe_id for (_, recipe_id), _ in groups},
+        ).update(**{counter: count_related(model, field)})
+        if model is ShoppingCart:
+            user_ids = {user_id for (user_id, _), _ in groups}
+            if user_ids:
+                rebuild_shopping_lists(apps, user_ids)
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    for _, ids in duplicates(IngredientRecipe, ('recipe_id', 'ingredient_id')):
+        rows = IngredientRecipe.objects.filter(id__in=ids)
+        total = sum(row.amount for row in rows)
+        rows.filter(id=ids[0]).update(amount=total)
+        rows.exclude(id=ids[0]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tagrecipe',
+            index=models.Index(fields=['tag', 'recipe'], name='tag_recipe_tag_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'favorite_recipe'), name='unique favourite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique ingredient in recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique recipe in shopping cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique tag in recipe'),
+        ),
+    ]
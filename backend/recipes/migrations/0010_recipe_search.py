@@ -0,0 +1,132 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:58
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRESQL_CREATE = (
+    "ALTER TABLE recipes_recipesearch ADD COLUMN vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', ingredients), 'B') || "
+    "setweight(to_tsvector('russian', text), 'C')"
+    ") STORED",
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON recipes_recipesearch USING GIN (vector)',
+)
+POSTGRESQL_DROP = (
+    'DROP INDEX recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipesearch DROP COLUMN vector',
+)
+# Внешнее содержимое FTS5: сам текст хранится только в recipes_recipesearch,
+# триггеры переносят каждое изменение в индекс.
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE recipes_recipesearch_fts USING fts5("
+    "name, ingredients, text, "
+    "content='recipes_recipesearch', content_rowid='recipe_id')",
+    # Ранг по умолчанию: bm25 с весами name, ingredients, text.
+    'INSERT INTO recipes_recipesearch_fts(recipes_recipesearch_fts, rank) '
+    "VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+    'CREATE TRIGGER recipes_recipesearch_ai '
+    'AFTER INSERT ON recipes_recipesearch BEGIN '
+    'INSERT INTO recipes_recipesearch_fts(rowid, name, ingredients, text) '
+    'VALUES (new.recipe_id, new.name, new.ingredients, new.text); '
+    'END',
+    'CREATE TRIGGER recipes_recipesearch_ad '
+    'AFTER DELETE ON recipes_recipesearch BEGIN '
+    'INSERT INTO recipes_recipesearch_fts'
+    '(recipes_recipesearch_fts, rowid, name, ingredients, text) '
+    "VALUES ('delete', old.recipe_id, old.name, old.ingredients, old.text); "
+    'END',
+    'CREATE TRIGGER recipes_recipesearch_au '
+    'AFTER UPDATE ON recipes_recipesearch BEGIN '
+    'INSERT INTO recipes_recipesearch_fts'
+    '(recipes_recipesearch_fts, rowid, name, ingredients, text) '
+    "VALUES ('delete', old.recipe_id, old.name, old.ingredients, old.text); "
+    'INSERT INTO recipes_recipesearch_fts(rowid, name, ingredients, text) '
+    'VALUES (new.recipe_id, new.name, new.ingredients, new.text); '
+    'END',
+)
+SQLITE_DROP = (
+    'DROP TRIGGER recipes_recipesearch_ai',
+    'DROP TRIGGER recipes_recipesearch_ad',
+    'DROP TRIGGER recipes_recipesearch_au',
+    'DROP TABLE recipes_recipesearch_fts',
+)
+BATCH_SIZE = 500
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    RecipeSearch = apps.get_model('recipes', 'RecipeSearch')
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id',
+        flat=True,
+    ))
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        ingredients = defaultdict(list)
+        for recipe_id, name in IngredientRecipe.objects.filter(
+            recipe_id__in=batch,
+        ).order_by('recipe_id', 'ingredient__name').values_list(
+            'recipe_id',
+            'ingredient__name',
+        ):
+            ingredients[recipe_id].append(name)
+        RecipeSearch.objects.bulk_create(
+            RecipeSearch(
+                recipe_id=recipe_id,
+                name=name,
+                ingredients=', '.join(ingredients[recipe_id]),
+                text=text,
+            )
+            for recipe_id, name, text in Recipe.objects.filter(
+                id__in=batch,
+            ).values_list('id', 'name', 'text')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearch',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('ingredients', models.TextField(verbose_name='Ингредиенты')),
+                ('text', models.TextField(verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ рецепта',
+                'verbose_name_plural': 'Поисковые документы рецептов',
+            },
+        ),
+        migrations.RunPython(
+            run_vendor_sql({
+                'postgresql': POSTGRESQL_CREATE,
+                'sqlite': SQLITE_CREATE,
+            }),
+            run_vendor_sql({
+                'postgresql': POSTGRESQL_DROP,
+                'sqlite': SQLITE_DROP,
+            }),
+        ),
+        migrations.RunPython(
+            fill_search_documents,
+            migrations.RunPython.noop,
+        ),
+    ]
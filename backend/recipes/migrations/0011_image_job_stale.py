@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagejob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка'), ('stale', 'Картинка заменена')], default='pending', max_length=16, verbose_name='Статус'),
+        ),
+    ]
@@ -1,8 +1,49 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from colorfield.fields import ColorField
+from core.cache import MembershipCache
+from core.db import (
+    delete_returning, delete_rows, insert_ignore, insert_ignore_many
+)
 from core.models import CreateModel
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (
+    BooleanField, Case, Exists, F, FloatField, OuterRef, Prefetch, Q, Sum,
+    Value, When, Window
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from users.models import Follow, User
+
+from .search import SEARCH_SQL, search_words
+
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+
+IMAGE_STATUSES = (
+    (IMAGE_PENDING, 'Обрабатывается'),
+    (IMAGE_READY, 'Готово'),
+    (IMAGE_FAILED, 'Ошибка'),
+)
+
+JOB_PENDING = 'pending'
+JOB_PROCESSING = 'processing'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_STALE = 'stale'
+
+JOB_STATUSES = (
+    (JOB_PENDING, 'В очереди'),
+    (JOB_PROCESSING, 'Выполняется'),
+    (JOB_DONE, 'Выполнено'),
+    (JOB_FAILED, 'Ошибка'),
+    (JOB_STALE, 'Картинка заменена'),
+)
 
 
 class Tag(models.Model):
@@ -58,6 +99,239 @@ class Ingredient(models.Model):
         )
 
 
+def membership_condition(membership, user):
+    """
+    Условие "рецепт входит в множество membership пользователя": список id
+    из кэша, а для больших множеств - подзапрос к таблице связей.
+    """
+    recipe_ids = membership.get(user.pk)
+    if len(recipe_ids) > settings.MEMBERSHIP_INLINE_MAX_SIZE:
+        return Q(pk__in=membership.queryset(user.pk))
+    return Q(pk__in=list(recipe_ids))
+
+
+def membership_flag(membership, user):
+    return Case(
+        When(membership_condition(membership, user), then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def annotate_user_flags(self, user):
+        """
+        Добавляет к рецептам флаги is_favorited и is_in_shopping_cart
+        для пользователя. id его избранного и корзины берутся из кэша,
+        поэтому таблицы связей на тёплом кэше не читаются.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=membership_flag(favorites_cache, user),
+            is_in_shopping_cart=membership_flag(shopping_cart_cache, user),
+        )
+
+    def touch(self):
+        """
+        Сдвигает дату изменения рецептов, а с ней и ETag, когда меняются
+        только связанные строки, например ингредиенты в админке.
+        """
+        return self.update(updated=timezone.now())
+
+    def favorited_by(self, user):
+        return self.filter(membership_condition(favorites_cache, user))
+
+    def in_shopping_cart_of(self, user):
+        return self.filter(membership_condition(shopping_cart_cache, user))
+
+    def annotate_author_subscription(self, user):
+        """
+        Добавляет флаг is_author_subscribed: подписан ли user на автора.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_author_subscribed=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_author_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('author'),
+            )),
+        )
+
+    def with_tags(self, tag_ids, match_all=False):
+        """
+        Рецепты хотя бы с одним из тегов tag_ids, а с match_all - со всеми.
+
+        Каждое условие - полусоединение EXISTS по индексу (recipe, tag)
+        связей TagRecipe, поэтому рецепт не повторяется при нескольких
+        совпавших тегах и DISTINCT не нужен.
+        """
+        tag_ids = sorted(set(tag_ids))
+        if not tag_ids:
+            return self.none()
+        if not match_all:
+            return self.annotate(has_tags=Exists(TagRecipe.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=tag_ids,
+            ))).filter(has_tags=True)
+        queryset = self
+        for tag_id in tag_ids:
+            name = f'has_tag_{tag_id}'
+            queryset = queryset.annotate(**{
+                name: Exists(TagRecipe.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag_id=tag_id,
+                )),
+            }).filter(**{name: True})
+        return queryset
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Возвращает {author_id: [рецепты]} для всех авторов одним запросом.
+
+        С limit берутся последние limit рецептов каждого автора: окно
+        ROW_NUMBER() OVER (PARTITION BY author_id) считается в подзапросе,
+        потому что Django 2.2 не умеет фильтровать по оконной функции.
+        Работает на PostgreSQL и SQLite 3.25+.
+        """
+        if not author_ids:
+            return {}
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            recipes = queryset.order_by('author_id', '-pub_date', '-id')
+        else:
+            ranked = queryset.order_by().annotate(
+                recipe_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=[F('pub_date').desc(), F('id').desc()],
+                ),
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                f'WHERE ranked.recipe_number <= %s '
+                f'ORDER BY ranked.author_id, ranked.recipe_number',
+                (*params, limit),
+            )
+        recipes_by_author = {}
+        for recipe in recipes:
+            recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+        return recipes_by_author
+
+    def refresh_popularity(self, now=None):
+        """
+        Пересчитывает popularity рецептов и возвращает число обновлённых.
+
+        Каждое добавление в избранное за последние POPULARITY_WINDOW_DAYS
+        дней даёт вклад 0.5 ** (возраст / POPULARITY_HALF_LIFE_HOURS).
+        Обходятся только рецепты со свежим избранным или ненулевым
+        рейтингом, пачками по POPULARITY_BATCH_SIZE; записываются
+        только изменившиеся значения.
+        """
+        now = now or timezone.now()
+        since = now - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+        half_life = timedelta(
+            hours=settings.POPULARITY_HALF_LIFE_HOURS,
+        ).total_seconds()
+        recipe_ids = set(
+            self.filter(popularity__gt=0).values_list('pk', flat=True)
+        )
+        recipe_ids.update(
+            Favorite.objects.filter(pub_date__gte=since).values_list(
+                'favorite_recipe_id',
+                flat=True,
+            ).distinct()
+        )
+        recipe_ids = sorted(recipe_ids)
+        updated = 0
+        for start in range(0, len(recipe_ids), settings.POPULARITY_BATCH_SIZE):
+            batch = recipe_ids[start:start + settings.POPULARITY_BATCH_SIZE]
+            scores = defaultdict(float)
+            for recipe_id, pub_date in Favorite.objects.filter(
+                favorite_recipe_id__in=batch,
+                pub_date__gte=since,
+            ).values_list('favorite_recipe_id', 'pub_date').iterator():
+                age = max((now - pub_date).total_seconds(), 0)
+                scores[recipe_id] += 0.5 ** (age / half_life)
+            changed = []
+            for recipe in self.filter(pk__in=batch).only('pk', 'popularity'):
+                popularity = round(scores[recipe.pk], 6)
+                if recipe.popularity != popularity:
+                    recipe.popularity = popularity
+                    changed.append(recipe)
+            with transaction.atomic():
+                self.bulk_update(changed, ('popularity',))
+            updated += len(changed)
+        return updated
+
+    def search(self, query):
+        """
+        Полнотекстовый поиск по названию, ингредиентам и описанию через
+        индекс RecipeSearch. Добавляет search_rank: чем больше, тем лучше
+        рецепт подходит к запросу. Слова ищутся по началу, рецепт должен
+        содержать их все.
+        """
+        words = search_words(query)
+        if not words:
+            return self.annotate(
+                search_rank=Value(0.0, output_field=FloatField()),
+            ).none()
+        connection = connections[self.db]
+        build_sql = SEARCH_SQL.get(connection.vendor)
+        if build_sql is None:
+            condition = Q()
+            for word in words:
+                condition &= (
+                    Q(search_document__name__icontains=word)
+                    | Q(search_document__ingredients__icontains=word)
+                    | Q(search_document__text__icontains=word)
+                )
+            return self.filter(condition).annotate(
+                search_rank=Value(0.0, output_field=FloatField()),
+            )
+        quote_name = connection.ops.quote_name
+        table, where, params, rank_sql, rank_params = build_sql(
+            words,
+            f'{quote_name(self.model._meta.db_table)}.{quote_name("id")}',
+        )
+        return self.extra(tables=[table], where=where, params=params).annotate(
+            search_rank=RawSQL(
+                rank_sql,
+                rank_params,
+                output_field=FloatField(),
+            ),
+        )
+
+    def for_read(self, user):
+        """
+        Выборка для чтения рецептов через RecipeGetSerializer.
+
+        Автор, теги и ингредиенты загружаются пачкой на всю выборку,
+        поэтому страница любого размера стоит постоянного числа запросов:
+        рецепты с флагами пользователя, авторы с флагом is_subscribed,
+        теги и ингредиенты рецептов (плюс COUNT для пагинации).
+        """
+        return self.annotate_user_flags(user).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate_is_subscribed(user),
+            ),
+            Prefetch(
+                'ingredient',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient',
+                ),
+            ),
+            'tags',
+        )
+
+
 class Recipe(CreateModel):
     """
     Модель рецептов.
@@ -85,9 +359,47 @@ class Recipe(CreateModel):
         validators=[MinValueValidator(1)],
         verbose_name='Время приготовления'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном',
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В списках покупок',
+    )
+    popularity = models.FloatField(
+        default=0,
+        verbose_name='Популярность',
+    )
+    image_status = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_PENDING,
+        verbose_name='Обработка картинки',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-popularity', '-id'),
+                name='recipe_popularity_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx',
+            ),
+            models.Index(
+                fields=('cooking_time', 'id'),
+                name='recipe_cooking_time_idx',
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -109,6 +421,20 @@ class TagRecipe(models.Model):
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'),
+                name='unique tag in recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('tag', 'recipe'),
+                name='tag_recipe_tag_idx',
+            ),
+        )
+
     def __str__(self):
         return f'{self.tag.slug} -- {self.recipe.name}'
 
@@ -133,6 +459,12 @@ class IngredientRecipe(models.Model):
     )
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique ingredient in recipe',
+            ),
+        )
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецептов'
 
@@ -140,7 +472,149 @@ class IngredientRecipe(models.Model):
         return f'{self.ingredient.name} -- {self.recipe.name}, {self.amount}'
 
 
-class Favorite(models.Model):
+class RecipeSearchManager(models.Manager):
+    @transaction.atomic
+    def refresh(self, recipe_ids):
+        """
+        Пересобирает поисковые документы рецептов recipe_ids тремя
+        запросами и возвращает их число. Индекс над таблицей база
+        обновляет сама.
+        """
+        recipe_ids = list(recipe_ids)
+        ingredients = defaultdict(list)
+        for recipe_id, name in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('recipe_id', 'ingredient__name').values_list(
+            'recipe_id',
+            'ingredient__name',
+        ):
+            ingredients[recipe_id].append(name)
+        documents = [
+            self.model(
+                recipe_id=recipe_id,
+                name=name,
+                ingredients=', '.join(ingredients[recipe_id]),
+                text=text,
+            )
+            for recipe_id, name, text in Recipe.objects.filter(
+                pk__in=recipe_ids,
+            ).values_list('pk', 'name', 'text')
+        ]
+        self.filter(recipe_id__in=recipe_ids).delete()
+        self.bulk_create(documents)
+        return len(documents)
+
+    def rebuild(self):
+        """
+        Пересобирает документы всех рецептов пачками по
+        RECIPE_SEARCH_BATCH_SIZE, например после переименования
+        ингредиентов.
+        """
+        recipe_ids = list(Recipe.objects.order_by('pk').values_list(
+            'pk',
+            flat=True,
+        ))
+        size = settings.RECIPE_SEARCH_BATCH_SIZE
+        return sum(
+            self.refresh(recipe_ids[start:start + size])
+            for start in range(0, len(recipe_ids), size)
+        )
+
+
+class RecipeSearch(models.Model):
+    """
+    Текст рецепта для полнотекстового поиска.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='Рецепт',
+    )
+    name = models.CharField(max_length=200, verbose_name='Название')
+    ingredients = models.TextField(verbose_name='Ингредиенты')
+    text = models.TextField(verbose_name='Описание')
+
+    objects = RecipeSearchManager()
+
+    class Meta:
+        verbose_name = 'Поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+
+    def __str__(self):
+        return self.name
+
+
+class FavoriteManager(models.Manager):
+    """
+    Добавление и удаление избранного одной командой без проверки
+    наличия заранее; счётчик рецепта меняется, только если строка
+    действительно добавилась или удалилась.
+    """
+
+    @transaction.atomic
+    def add(self, user, recipe):
+        created = insert_ignore(self.model, user=user, favorite_recipe=recipe)
+        if created:
+            favorites_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=F('favorites_count') + 1,
+            )
+        return created
+
+    @transaction.atomic
+    def remove(self, user, recipe_id):
+        removed = delete_rows(
+            self.model,
+            user=user,
+            favorite_recipe_id=recipe_id,
+        )
+        if removed:
+            favorites_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk=recipe_id).update(
+                favorites_count=F('favorites_count') - removed,
+            )
+        return bool(removed)
+
+    @transaction.atomic
+    def add_many(self, user, recipe_ids):
+        """
+        Добавляет рецепты в избранное одной вставкой и возвращает id
+        рецептов, которых там ещё не было.
+        """
+        created = insert_ignore_many(
+            self.model,
+            [
+                {'user': user, 'favorite_recipe_id': recipe_id}
+                for recipe_id in recipe_ids
+            ],
+            'favorite_recipe_id',
+        )
+        if created:
+            favorites_cache.invalidate_on_commit(user.pk)
+        Recipe.objects.filter(pk__in=created).update(
+            favorites_count=F('favorites_count') + 1,
+        )
+        return created
+
+    @transaction.atomic
+    def remove_many(self, user, recipe_ids):
+        removed = delete_returning(
+            self.model,
+            'favorite_recipe_id',
+            user=user,
+            favorite_recipe_id=list(recipe_ids),
+        )
+        if removed:
+            favorites_cache.invalidate_on_commit(user.pk)
+        Recipe.objects.filter(pk__in=removed).update(
+            favorites_count=F('favorites_count') - 1,
+        )
+        return removed
+
+
+class Favorite(CreateModel):
     """
     Модель избранного.
     """
@@ -157,10 +631,14 @@ class Favorite(models.Model):
         verbose_name='Избранный рецепт'
     )
 
+    objects = FavoriteManager()
+
     class Meta:
-        models.UniqueConstraint(
-            fields=('user', 'favorite_recipe'),
-            name='unique favourite',
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'favorite_recipe'),
+                name='unique favourite',
+            ),
         )
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
@@ -172,6 +650,74 @@ class Favorite(models.Model):
         )
 
 
+class ShoppingCartManager(models.Manager):
+    """
+    Добавление и удаление рецепта в корзине одной командой; счётчик
+    рецепта и сводный список покупок меняются, только если корзина
+    действительно изменилась.
+    """
+
+    @transaction.atomic
+    def add(self, user, recipe):
+        created = insert_ignore(self.model, user=user, recipe=recipe)
+        if created:
+            shopping_cart_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                shopping_cart_count=F('shopping_cart_count') + 1,
+            )
+            ShoppingListItem.objects.add_recipe(user.pk, recipe)
+        return created
+
+    @transaction.atomic
+    def remove(self, user, recipe_id):
+        removed = delete_rows(self.model, user=user, recipe_id=recipe_id)
+        if removed:
+            shopping_cart_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk=recipe_id).update(
+                shopping_cart_count=F('shopping_cart_count') - removed,
+            )
+            ShoppingListItem.objects.remove_recipe(user.pk, recipe_id)
+        return bool(removed)
+
+    @transaction.atomic
+    def add_many(self, user, recipe_ids):
+        """
+        Добавляет рецепты в корзину одной вставкой и возвращает id
+        рецептов, которых там ещё не было.
+        """
+        created = insert_ignore_many(
+            self.model,
+            [
+                {'user': user, 'recipe_id': recipe_id}
+                for recipe_id in recipe_ids
+            ],
+            'recipe_id',
+        )
+        if created:
+            shopping_cart_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk__in=created).update(
+                shopping_cart_count=F('shopping_cart_count') + 1,
+            )
+            ShoppingListItem.objects.add_recipes(user.pk, created)
+        return created
+
+    @transaction.atomic
+    def remove_many(self, user, recipe_ids):
+        removed = delete_returning(
+            self.model,
+            'recipe_id',
+            user=user,
+            recipe_id=list(recipe_ids),
+        )
+        if removed:
+            shopping_cart_cache.invalidate_on_commit(user.pk)
+            Recipe.objects.filter(pk__in=removed).update(
+                shopping_cart_count=F('shopping_cart_count') - 1,
+            )
+            ShoppingListItem.objects.remove_recipes(user.pk, removed)
+        return removed
+
+
 class ShoppingCart(models.Model):
     """
     Модель списка покупок.
@@ -189,10 +735,14 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = ShoppingCartManager()
+
     class Meta:
-        models.UniqueConstraint(
-            fields=('user', 'recipe'),
-            name='unique recipe in shopping cart'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique recipe in shopping cart',
+            ),
         )
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
@@ -202,3 +752,416 @@ class ShoppingCart(models.Model):
             f'user: {self.user.username}, '
             f'recipe in shopping cart: {self.recipe.name}'
         )
+
+
+favorites_cache = MembershipCache(
+    'favorites',
+    lambda user_id: Favorite.objects.filter(user_id=user_id).values_list(
+        'favorite_recipe_id',
+        flat=True,
+    ),
+)
+shopping_cart_cache = MembershipCache(
+    'shopping_cart',
+    lambda user_id: ShoppingCart.objects.filter(user_id=user_id).values_list(
+        'recipe_id',
+        flat=True,
+    ),
+)
+
+
+class ShoppingListItemManager(models.Manager):
+    """
+    Поддерживает сводный список покупок в актуальном состоянии.
+
+    Изменения передаются словарём {(user_id, ingredient_id): delta}
+    и применяются пачкой; строки, чьё количество дошло до нуля, удаляются.
+    """
+
+    @transaction.atomic
+    def apply_changes(self, changes):
+        changes = {key: delta for key, delta in changes.items() if delta}
+        if not changes:
+            return
+        user_ids = sorted({user_id for user_id, _ in changes})
+        ingredient_ids = {ingredient_id for _, ingredient_id in changes}
+        # Блокировка пользователей упорядочивает параллельные изменения
+        # одного списка покупок.
+        list(User.objects.select_for_update().filter(
+            id__in=user_ids,
+        ).order_by('id').values_list('id', flat=True))
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in self.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=ingredient_ids,
+            )
+        }
+        to_create, to_update, to_delete = [], [], []
+        for (user_id, ingredient_id), delta in changes.items():
+            item = items.get((user_id, ingredient_id))
+            if item is None:
+                if delta > 0:
+                    to_create.append(self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=delta,
+                    ))
+                continue
+            item.amount += delta
+            if item.amount > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.id)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ('amount',))
+        self.filter(id__in=to_delete).delete()
+
+    def add_recipes(self, user_id, recipes):
+        self.apply_changes({
+            (user_id, ingredient_id): amount
+            for ingredient_id, amount in recipes_amounts(recipes).items()
+        })
+
+    def remove_recipes(self, user_id, recipes):
+        self.apply_changes({
+            (user_id, ingredient_id): -amount
+            for ingredient_id, amount in recipes_amounts(recipes).items()
+        })
+
+    def add_recipe(self, user_id, recipe):
+        self.add_recipes(user_id, [recipe])
+
+    def remove_recipe(self, user_id, recipe):
+        self.remove_recipes(user_id, [recipe])
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """
+        Переносит изменение ингредиентов рецепта в списки покупок
+        всех пользователей, у которых рецепт лежит в корзине.
+        """
+        diff = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in set(old_amounts) | set(new_amounts)
+        }
+        if not any(diff.values()):
+            return
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe,
+        ).values_list('user_id', flat=True)
+        self.apply_changes({
+            (user_id, ingredient_id): delta
+            for user_id in user_ids
+            for ingredient_id, delta in diff.items()
+        })
+
+    def live_totals(self, user_ids=None):
+        """
+        Считает списки покупок напрямую по корзинам и рецептам.
+        """
+        queryset = IngredientRecipe.objects.filter(
+            recipe__recipe_in_shopping_cart__isnull=False,
+        )
+        if user_ids is not None:
+            queryset = queryset.filter(
+                recipe__recipe_in_shopping_cart__user__in=user_ids,
+            )
+        rows = queryset.values_list(
+            'recipe__recipe_in_shopping_cart__user',
+            'ingredient',
+        ).annotate(total=Sum('amount')).order_by()
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows
+        }
+
+    def stored_totals(self, user_ids=None):
+        queryset = self.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in queryset.values_list(
+                'user_id', 'ingredient_id', 'amount',
+            )
+        }
+
+    @transaction.atomic
+    def rebuild(self, user_ids=None):
+        queryset = self.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        queryset.delete()
+        self.bulk_create(
+            self.model(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                amount=total,
+            )
+            for (user_id, ingredient_id), total in self.live_totals(
+                user_ids,
+            ).items()
+        )
+
+
+def recipe_amounts(recipe):
+    """
+    Возвращает количества ингредиентов рецепта: {ingredient_id: amount}.
+    """
+    return recipes_amounts([recipe])
+
+
+def recipes_amounts(recipes):
+    """
+    Суммарные количества ингредиентов нескольких рецептов (объектов
+    или id): {ingredient_id: amount}.
+    """
+    return dict(
+        IngredientRecipe.objects.filter(recipe__in=recipes).values_list(
+            'ingredient_id',
+        ).annotate(total=Sum('amount')).order_by()
+    )
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель сводного списка покупок пользователя.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique ingredient in shopping list',
+            ),
+        )
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+
+    def __str__(self):
+        return (
+            f'user: {self.user.username}, '
+            f'ingredient: {self.ingredient.name}, '
+            f'amount: {self.amount}'
+        )
+
+
+class FeedEntryManager(models.Manager):
+    """
+    Лента подписок, собираемая при записи (fan-out on write): новый рецепт
+    сразу раскладывается в ленты всех подписчиков автора.
+    """
+
+    def fan_out(self, recipe):
+        follower_ids = Follow.objects.filter(
+            author_id=recipe.author_id,
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=follower_id,
+                    author_id=recipe.author_id,
+                    recipe=recipe,
+                    pub_date=recipe.pub_date,
+                )
+                for follower_id in follower_ids.iterator()
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+        )
+
+    def backfill(self, user_id, author_id):
+        """
+        Добавляет в ленту подписчика последние рецепты нового автора.
+        """
+        self.backfill_authors(user_id, [author_id])
+
+    def backfill_authors(self, user_id, author_ids):
+        """
+        Добавляет в ленту подписчика последние рецепты новых авторов,
+        по FEED_BACKFILL_SIZE от каждого, одной выборкой.
+        """
+        if not author_ids:
+            return
+        recipes_by_author = Recipe.objects.only(
+            'id', 'author', 'pub_date',
+        ).latest_by_author(author_ids, settings.FEED_BACKFILL_SIZE)
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    author_id=recipe.author_id,
+                    recipe_id=recipe.id,
+                    pub_date=recipe.pub_date,
+                )
+                for recipes in recipes_by_author.values()
+                for recipe in recipes
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+        )
+
+    def remove_author(self, user_id, author_id):
+        self.remove_authors(user_id, [author_id])
+
+    def remove_authors(self, user_id, author_ids):
+        if not author_ids:
+            return
+        self.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        self.all().delete()
+        for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id',
+        ).iterator():
+            self.backfill(user_id, author_id)
+
+
+class FeedEntry(models.Model):
+    """
+    Модель ленты подписок: рецепт автора в ленте подписчика.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        ordering = ('-pub_date', '-id')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique recipe in feed',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date'),
+                name='feed_user_pub_date_idx',
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'user: {self.user.username}, recipe: {self.recipe.name}'
+
+
+class ImageJobManager(models.Manager):
+    """
+    Очередь обработки картинок рецептов в базе данных.
+    """
+
+    def claim(self, job_id):
+        """
+        Забирает задачу в работу условным UPDATE: из нескольких
+        воркеров задачу получит только один.
+        """
+        return self.filter(pk=job_id, status=JOB_PENDING).update(
+            status=JOB_PROCESSING,
+            attempts=F('attempts') + 1,
+            started=timezone.now(),
+        ) == 1
+
+    def pending_ids(self, limit=None):
+        ids = self.filter(status=JOB_PENDING).values_list('pk', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    def requeue_stale(self):
+        """
+        Возвращает в очередь задачи, чей воркер не отчитался дольше
+        IMAGE_JOB_TIMEOUT секунд, например после перезапуска.
+        """
+        stale = self.filter(
+            status=JOB_PROCESSING,
+            started__lt=timezone.now() - timedelta(
+                seconds=settings.IMAGE_JOB_TIMEOUT,
+            ),
+        )
+        stale.filter(attempts__gte=settings.IMAGE_JOB_MAX_ATTEMPTS).update(
+            status=JOB_FAILED,
+            error='Timed out',
+            finished=timezone.now(),
+        )
+        return stale.update(status=JOB_PENDING)
+
+
+class ImageJob(models.Model):
+    """
+    Модель задачи на обработку картинки рецепта.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Рецепт'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=JOB_STATUSES,
+        default=JOB_PENDING,
+        verbose_name='Статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попытки',
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана',
+    )
+    started = models.DateTimeField(null=True, verbose_name='Начата')
+    finished = models.DateTimeField(null=True, verbose_name='Завершена')
+
+    objects = ImageJobManager()
+
+    class Meta:
+        ordering = ('id',)
+        indexes = (
+            models.Index(
+                fields=('status', 'id'),
+                name='image_job_status_idx',
+            ),
+        )
+        verbose_name = 'Обработка картинки'
+        verbose_name_plural = 'Обработка картинок'
+
+    def __str__(self):
+        return f'recipe: {self.recipe_id}, status: {self.status}'
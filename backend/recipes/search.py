@@ -0,0 +1,58 @@
+import re
+
+from django.conf import settings
+
+# Индекс над таблицей RecipeSearch создаёт миграция 0010_recipe_search:
+# в PostgreSQL - вычисляемый столбец vector с GIN-индексом,
+# в SQLite - виртуальная таблица FTS5, которую ведут триггеры.
+SEARCH_TABLE = 'recipes_recipesearch'
+FTS_TABLE = 'recipes_recipesearch_fts'
+SEARCH_CONFIG = 'russian'
+
+WORD = re.compile(r'[^\W_]+')
+
+
+def search_words(query):
+    """
+    Слова запроса без знаков препинания и операторов языка запросов.
+    """
+    return WORD.findall(query.lower())[:settings.RECIPE_SEARCH_MAX_WORDS]
+
+
+def postgresql_sql(words, recipe_id):
+    tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+    params = (' & '.join(f'{word}:*' for word in words),)
+    return (
+        SEARCH_TABLE,
+        (
+            f'{SEARCH_TABLE}.recipe_id = {recipe_id}',
+            f'{SEARCH_TABLE}.vector @@ {tsquery}',
+        ),
+        params,
+        f'ts_rank({SEARCH_TABLE}.vector, {tsquery})::float8',
+        params,
+    )
+
+
+def sqlite_sql(words, recipe_id):
+    # Столбец rank - это bm25 с весами из миграции; меньше - лучше.
+    return (
+        FTS_TABLE,
+        (
+            f'{FTS_TABLE}.rowid = {recipe_id}',
+            f'{FTS_TABLE} MATCH %s',
+        ),
+        (' '.join(f'"{word}"*' for word in words),),
+        f'-{FTS_TABLE}.rank',
+        (),
+    )
+
+
+# vendor: функция (слова, столбец id рецепта) -> (таблица индекса,
+# условия соединения с рецептами, их параметры, SQL ранга, его параметры).
+# Индекс присоединяется к рецептам, а не проверяется подзапросом:
+# ранг считается за один проход по найденным строкам.
+SEARCH_SQL = {
+    'postgresql': postgresql_sql,
+    'sqlite': sqlite_sql,
+}
@@ -0,0 +1,210 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from users.models import Follow, User
+
+from .cache import ingredients_cache, tags_cache
+from .models import (
+    Favorite, FeedEntry, Ingredient, Recipe, ShoppingCart, ShoppingListItem,
+    Tag, favorites_cache, recipe_amounts, shopping_cart_cache
+)
+
+# id рецептов, удаляемых в этом потоке: их корзины уже убраны
+# из списков покупок одним пакетом до каскадного удаления.
+deleting_recipes = threading.local()
+
+
+def recipes_being_deleted():
+    if not hasattr(deleting_recipes, 'ids'):
+        deleting_recipes.ids = set()
+    return deleting_recipes.ids
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    transaction.on_commit(tags_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients_cache(sender, **kwargs):
+    transaction.on_commit(ingredients_cache.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe(sender, instance, created, **kwargs):
+    if not created:
+        return
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') + 1,
+    )
+    FeedEntry.objects.fan_out(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def unlist_deleted_recipe(sender, instance, **kwargs):
+    """
+    Пока корзины и ингредиенты рецепта ещё не удалены каскадом, рецепт
+    одним пакетом убирается из списков покупок всех, у кого он в корзине;
+    post_delete этих корзин списки уже не меняет.
+    """
+    ShoppingListItem.objects.change_recipe(
+        instance,
+        recipe_amounts(instance),
+        {},
+    )
+    recipes_being_deleted().add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def unpublish_recipe(sender, instance, **kwargs):
+    recipes_being_deleted().discard(instance.pk)
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') - 1,
+    )
+
+
+@receiver(pre_save, sender=Follow)
+def release_replaced_follow(sender, instance, **kwargs):
+    """
+    Сохранение существующей подписки с другим автором или подписчиком,
+    например в админке, снимает прежнюю версию со счётчика автора
+    и из ленты, как release_replaced_shopping_cart для корзины.
+    """
+    if instance.pk is None:
+        return
+    previous = Follow.objects.filter(pk=instance.pk).values_list(
+        'user_id',
+        'author_id',
+    ).first()
+    if previous is None:
+        return
+    user_id, author_id = previous
+    User.objects.filter(pk=author_id).update(
+        followers_count=F('followers_count') - 1,
+    )
+    FeedEntry.objects.remove_author(user_id, author_id)
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed(sender, instance, **kwargs):
+    # Прежнюю версию сохраняемой подписки уже снял release_replaced_follow.
+    User.objects.filter(pk=instance.author_id).update(
+        followers_count=F('followers_count') + 1,
+    )
+    FeedEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        followers_count=F('followers_count') - 1,
+    )
+    FeedEntry.objects.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Favorite)
+def release_replaced_favorite(sender, instance, **kwargs):
+    """
+    Сохранение существующего избранного с другим рецептом или
+    пользователем снимает прежнюю версию со счётчика рецепта
+    и сбрасывает кэш избранного прежнего пользователя.
+    """
+    if instance.pk is None:
+        return
+    previous = Favorite.objects.filter(pk=instance.pk).values_list(
+        'user_id',
+        'favorite_recipe_id',
+    ).first()
+    if previous is None:
+        return
+    user_id, recipe_id = previous
+    Recipe.objects.filter(pk=recipe_id).update(
+        favorites_count=F('favorites_count') - 1,
+    )
+    favorites_cache.invalidate_on_commit(user_id)
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite(sender, instance, **kwargs):
+    # Прежнюю версию сохраняемого избранного уже вычел
+    # release_replaced_favorite.
+    Recipe.objects.filter(pk=instance.favorite_recipe_id).update(
+        favorites_count=F('favorites_count') + 1,
+    )
+
+
+@receiver(post_delete, sender=Favorite)
+def uncount_favorite(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.favorite_recipe_id).update(
+        favorites_count=F('favorites_count') - 1,
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def count_shopping_cart(sender, instance, **kwargs):
+    # Прежнюю версию сохраняемой корзины уже вычел
+    # release_replaced_shopping_cart.
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        shopping_cart_count=F('shopping_cart_count') + 1,
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def uncount_shopping_cart(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        shopping_cart_count=F('shopping_cart_count') - 1,
+    )
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def release_replaced_shopping_cart(sender, instance, **kwargs):
+    """
+    Сохранение существующей корзины, например в админке, сначала
+    снимает её прежнюю версию со счётчика рецепта и из списка покупок,
+    а post_save добавляет новую. Менеджер корзины пишет без сигналов
+    и меняет счётчик и список сам.
+    """
+    if instance.pk is None:
+        return
+    previous = ShoppingCart.objects.filter(pk=instance.pk).values_list(
+        'user_id',
+        'recipe_id',
+    ).first()
+    if previous is None:
+        return
+    user_id, recipe_id = previous
+    Recipe.objects.filter(pk=recipe_id).update(
+        shopping_cart_count=F('shopping_cart_count') - 1,
+    )
+    ShoppingListItem.objects.remove_recipe(user_id, recipe_id)
+    shopping_cart_cache.invalidate_on_commit(user_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def list_shopping_cart(sender, instance, **kwargs):
+    ShoppingListItem.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def unlist_shopping_cart(sender, instance, **kwargs):
+    if instance.recipe_id in recipes_being_deleted():
+        return
+    ShoppingListItem.objects.remove_recipe(
+        instance.user_id,
+        instance.recipe_id,
+    )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def invalidate_favorites_cache(sender, instance, **kwargs):
+    favorites_cache.invalidate_on_commit(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_shopping_cart_cache(sender, instance, **kwargs):
+    shopping_cart_cache.invalidate_on_commit(instance.user_id)
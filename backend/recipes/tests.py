@@ -0,0 +1,466 @@
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest.mock import patch
+
+from core.cache import MembershipCache
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from PIL import Image
+from users.models import Follow, User
+
+from . import images
+from .admin import IngredientRecipeAdmin
+from .models import (
+    IMAGE_READY, JOB_DONE, JOB_STALE, Favorite, Ingredient, IngredientRecipe,
+    Recipe, ShoppingCart, ShoppingListItem
+)
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipes-tests',
+    },
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ShoppingListTest(TestCase):
+    """
+    Сводный список покупок совпадает с пересчётом по корзинам, как бы
+    ни менялись корзины и рецепты: через менеджер или ORM и админку.
+    """
+
+    def setUp(self):
+        # Тесты удаляют объекты, поэтому они создаются заново для
+        # каждого теста, а не в setUpTestData.
+        cache.clear()
+        self.author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        self.users = [
+            User.objects.create(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+            )
+            for number in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г',
+            )
+            for number in range(3)
+        ]
+        self.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/test.png',
+            )
+            for amount, ingredient in enumerate(self.ingredients, 1):
+                IngredientRecipe.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=amount * (number + 1),
+                )
+            self.recipes.append(recipe)
+
+    def assert_lists_match_carts(self):
+        self.assertEqual(
+            ShoppingListItem.objects.stored_totals(),
+            ShoppingListItem.objects.live_totals(),
+        )
+
+    def fill_carts(self):
+        for user in self.users:
+            for recipe in self.recipes[:2]:
+                ShoppingCart.objects.add(user, recipe)
+        self.assert_lists_match_carts()
+        self.assertTrue(ShoppingListItem.objects.exists())
+
+    def test_manager(self):
+        self.fill_carts()
+        ShoppingCart.objects.remove(self.users[0], self.recipes[0].id)
+        ShoppingCart.objects.remove_many(
+            self.users[1],
+            [recipe.id for recipe in self.recipes],
+        )
+        ShoppingCart.objects.add_many(
+            self.users[2],
+            [recipe.id for recipe in self.recipes],
+        )
+        self.assert_lists_match_carts()
+
+    def test_orm_shopping_cart(self):
+        cart = ShoppingCart.objects.create(
+            user=self.users[0],
+            recipe=self.recipes[0],
+        )
+        self.assert_lists_match_carts()
+        cart.recipe = self.recipes[1]
+        cart.save()
+        self.assert_lists_match_carts()
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'shopping_cart_count')),
+            {
+                self.recipes[0].id: 0,
+                self.recipes[1].id: 1,
+                self.recipes[2].id: 0,
+            },
+        )
+        cart.delete()
+        self.assert_lists_match_carts()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_delete_recipe(self):
+        self.fill_carts()
+        self.recipes[0].delete()
+        self.assert_lists_match_carts()
+
+    def test_delete_recipes_queryset(self):
+        self.fill_carts()
+        Recipe.objects.filter(id__in=[self.recipes[0].id]).delete()
+        ShoppingCart.objects.filter(user=self.users[0]).delete()
+        self.assert_lists_match_carts()
+
+    def test_delete_author(self):
+        self.fill_carts()
+        self.author.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_delete_user(self):
+        self.fill_carts()
+        self.users[0].delete()
+        self.assert_lists_match_carts()
+
+    def test_admin_ingredient_recipe(self):
+        self.fill_carts()
+        model_admin = IngredientRecipeAdmin(IngredientRecipe, admin.site)
+        row = IngredientRecipe.objects.filter(recipe=self.recipes[0]).first()
+        row.amount += 100
+        model_admin.save_model(None, row, None, True)
+        self.assert_lists_match_carts()
+        model_admin.save_model(
+            None,
+            IngredientRecipe(
+                recipe=self.recipes[1],
+                ingredient=Ingredient.objects.create(
+                    name='Новый ингредиент',
+                    measurement_unit='г',
+                ),
+                amount=5,
+            ),
+            None,
+            False,
+        )
+        self.assert_lists_match_carts()
+        model_admin.delete_model(None, row)
+        model_admin.delete_queryset(
+            None,
+            IngredientRecipe.objects.filter(recipe=self.recipes[1]),
+        )
+        self.assert_lists_match_carts()
+        # Каждая правка сдвигает дату изменения рецепта.
+        for recipe in self.recipes[:2]:
+            updated = recipe.updated
+            recipe.refresh_from_db()
+            self.assertGreater(recipe.updated, updated)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplacedRelationTest(TestCase):
+    """
+    Сохранение избранного или подписки с другим рецептом или автором
+    переносит счётчики и ленту на новый объект.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        self.authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+            )
+            for number in range(2)
+        ]
+        self.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/test.png',
+            )
+            for number, author in enumerate(self.authors)
+        ]
+
+    def test_orm_favorite(self):
+        favorite = Favorite.objects.create(
+            user=self.user,
+            favorite_recipe=self.recipes[0],
+        )
+        favorite.favorite_recipe = self.recipes[1]
+        favorite.save()
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorites_count')),
+            {self.recipes[0].id: 0, self.recipes[1].id: 1},
+        )
+        favorite.delete()
+        self.assertFalse(Recipe.objects.filter(favorites_count__gt=0))
+
+    def test_orm_follow(self):
+        follow = Follow.objects.create(user=self.user, author=self.authors[0])
+        follow.author = self.authors[1]
+        follow.save()
+        self.assertEqual(
+            dict(User.objects.filter(
+                pk__in=[author.pk for author in self.authors],
+            ).values_list('id', 'followers_count')),
+            {self.authors[0].id: 0, self.authors[1].id: 1},
+        )
+        self.assertEqual(
+            list(self.user.feed.values_list('recipe_id', flat=True)),
+            [self.recipes[1].id],
+        )
+        follow.delete()
+        self.assertFalse(User.objects.filter(followers_count__gt=0))
+        self.assertFalse(self.user.feed.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImageJobTest(TestCase):
+    """
+    Задача, закончившая обработку после замены картинки, не удаляет
+    варианты новой картинки.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        self.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image=self.save_image('old.png'),
+        )
+
+    @staticmethod
+    def save_image(name):
+        buffer = BytesIO()
+        Image.new('RGB', (32, 32)).save(buffer, format='PNG')
+        return default_storage.save(
+            f'recipes/{name}',
+            ContentFile(buffer.getvalue()),
+        )
+
+    def replace_image(self, name):
+        self.recipe.image = self.save_image(name)
+        self.recipe.save()
+        return images.enqueue(self.recipe)
+
+    def variants(self):
+        _, files = default_storage.listdir(images.variant_dir(self.recipe.pk))
+        return sorted(files)
+
+    def test_older_job_finishes_last(self):
+        # Картинку заменяют, и новая задача успевает закончить, пока
+        # первая задача рисует варианты прежней картинки.
+        render_variants = images.render_variants
+        new_jobs = []
+
+        def replace_during_render(file):
+            if not new_jobs:
+                new_jobs.append(self.replace_image('new.png'))
+                self.assertTrue(images.process_job(new_jobs[0].pk))
+                self.new_variants = self.variants()
+            return render_variants(file)
+
+        old_job = images.enqueue(self.recipe)
+        with patch.object(images, 'render_variants', replace_during_render):
+            self.assertTrue(images.process_job(old_job.pk))
+        self.assertEqual(self.variants(), self.new_variants)
+        old_job.refresh_from_db()
+        new_jobs[0].refresh_from_db()
+        self.assertEqual(old_job.status, JOB_STALE)
+        self.assertEqual(new_jobs[0].status, JOB_DONE)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, IMAGE_READY)
+
+    def test_replaced_variants_removed(self):
+        self.assertTrue(images.process_job(images.enqueue(self.recipe).pk))
+        self.assertTrue(images.process_job(self.replace_image('new.png').pk))
+        self.assertTrue(all(
+            name.startswith('new') for name in self.variants()
+        ))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MembershipCacheTest(SimpleTestCase):
+    """
+    Множество, загруженное до инвалидации, не попадает в кэш.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.stored = {1: [10]}
+        self.membership = MembershipCache('test', self.load)
+        self.on_load = None
+
+    def load(self, user_id):
+        ids = self.stored[user_id]
+        if self.on_load is not None:
+            self.on_load()
+        return list(ids)
+
+    def change(self, ids):
+        self.stored[1] = ids
+        self.membership.invalidate(1)
+
+    def test_cached(self):
+        self.assertEqual(list(self.membership.get(1)), [10])
+        self.stored[1] = [20]
+        self.assertEqual(list(self.membership.get(1)), [10])
+
+    def test_invalidate(self):
+        self.membership.get(1)
+        self.change([20])
+        self.assertEqual(list(self.membership.get(1)), [20])
+
+    def test_change_during_load(self):
+        # Связи меняются и инвалидируются после того, как чтение
+        # загрузило множество, но до записи его в кэш.
+        self.on_load = lambda: self.change([20])
+        self.assertEqual(list(self.membership.get(1)), [10])
+        self.on_load = None
+        self.assertEqual(list(self.membership.get(1)), [20])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrentRelationsTest(TransactionTestCase):
+    """
+    Одновременные одинаковые добавления и удаления из разных потоков
+    оставляют одну строку (или ни одной) и верные счётчики.
+
+    Тестовая база SQLite в памяти не даёт потокам писать параллельно,
+    поэтому для SQLite нужен файл: DB_TEST_NAME=/tmp/foodgram_test.db.
+    """
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Нужна тестовая база SQLite в файле.')
+        cache.clear()
+        self.author = User.objects.create(
+            username='author',
+            email='author@example.com',
+        )
+        self.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/test.png',
+        )
+        IngredientRecipe.objects.create(
+            recipe=self.recipe,
+            ingredient=Ingredient.objects.create(
+                name='Ингредиент',
+                measurement_unit='г',
+            ),
+            amount=10,
+        )
+
+    def run_concurrently(self, action):
+        """
+        Вызывает action одновременно из self.threads потоков
+        и возвращает результаты вызовов.
+        """
+        barrier = threading.Barrier(self.threads)
+
+        def run():
+            try:
+                barrier.wait()
+                return action()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [executor.submit(run) for _ in range(self.threads)]
+            return [future.result() for future in futures]
+
+    def test_favorite(self):
+        results = self.run_concurrently(
+            lambda: Favorite.objects.add(self.user, self.recipe),
+        )
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        results = self.run_concurrently(
+            lambda: Favorite.objects.remove(self.user, self.recipe.id),
+        )
+        self.assertEqual(results.count(True), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        results = self.run_concurrently(
+            lambda: ShoppingCart.objects.add(self.user, self.recipe),
+        )
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_cart_count, 1)
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list('amount', flat=True)),
+            [10],
+        )
+        self.run_concurrently(
+            lambda: ShoppingCart.objects.remove(self.user, self.recipe.id),
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_cart_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_follow(self):
+        results = self.run_concurrently(
+            lambda: Follow.objects.add(self.user, self.author),
+        )
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.run_concurrently(
+            lambda: Follow.objects.remove(self.user, self.author.id),
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
@@ -4,9 +4,16 @@ from .models import Follow, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'access_level')
+    list_display = (
+        'username',
+        'email',
+        'access_level',
+        'recipes_count',
+        'followers_count',
+    )
     search_fields = ('username', 'email', 'access_level')
     list_filter = ('username', 'email')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
 class TagAdmin(admin.ModelAdmin):
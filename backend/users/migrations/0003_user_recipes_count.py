@@ -0,0 +1,36 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User.objects.update(recipes_count=Coalesce(
+        models.Subquery(
+            Recipe.objects.filter(
+                author=models.OuterRef('pk'),
+            ).order_by().values('author').annotate(
+                count=models.Count('id'),
+            ).values('count'),
+        ),
+        0,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_manager'),
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:38
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_followers(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    User.objects.update(followers_count=Coalesce(
+        models.Subquery(
+            Follow.objects.filter(
+                author=models.OuterRef('pk'),
+            ).order_by().values('author').annotate(
+                count=models.Count('id'),
+            ).values('count'),
+        ),
+        0,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Удаляет повторные подписки. followers_count посчитан в 0004
+    вместе с повторами, поэтому у их авторов он пересчитывается.
+    """
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    seen = set()
+    duplicate_ids = []
+    author_ids = set()
+    for follow_id, user_id, author_id in Follow.objects.order_by(
+        'id',
+    ).values_list('id', 'user_id', 'author_id'):
+        if (user_id, author_id) in seen:
+            duplicate_ids.append(follow_id)
+            author_ids.add(author_id)
+        seen.add((user_id, author_id))
+    Follow.objects.filter(id__in=duplicate_ids).delete()
+    User.objects.filter(id__in=author_ids).update(followers_count=Coalesce(
+        models.Subquery(
+            Follow.objects.filter(
+                author=models.OuterRef('pk'),
+            ).order_by().values('author').annotate(
+                count=models.Count('id'),
+            ).values('count'),
+        ),
+        0,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_followers_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique follow'),
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from core.db import (
+    delete_returning, delete_rows, insert_ignore, insert_ignore_many
+)
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db import models, transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
 
 USER = 'user'
 ADMIN = 'admin'
@@ -10,6 +14,27 @@ ACCESS_LEVELS = (
 )
 
 
+class UserQuerySet(models.QuerySet):
+    def annotate_is_subscribed(self, user):
+        """
+        Добавляет к пользователям флаг is_subscribed для пользователя user.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('pk'),
+            )),
+        )
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     """
     Кастомная модель пользователя.
@@ -26,6 +51,16 @@ class User(AbstractUser):
         default='user',
         verbose_name='Уровень доступа'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
+
+    objects = CustomUserManager()
 
     class Meta:
         ordering = ('username',)
@@ -37,6 +72,63 @@ class User(AbstractUser):
         return self.is_superuser or self.access_level == ADMIN
 
 
+class FollowManager(models.Manager):
+    """
+    Подписка и отписка одной командой; счётчик подписчиков автора
+    меняется, только если подписка действительно появилась или исчезла.
+    """
+
+    @transaction.atomic
+    def add(self, user, author):
+        created = insert_ignore(self.model, user=user, author=author)
+        if created:
+            User.objects.filter(pk=author.pk).update(
+                followers_count=F('followers_count') + 1,
+            )
+        return created
+
+    @transaction.atomic
+    def remove(self, user, author_id):
+        removed = delete_rows(self.model, user=user, author_id=author_id)
+        if removed:
+            User.objects.filter(pk=author_id).update(
+                followers_count=F('followers_count') - removed,
+            )
+        return bool(removed)
+
+    @transaction.atomic
+    def add_many(self, user, author_ids):
+        """
+        Подписывает на авторов одной вставкой и возвращает id авторов,
+        на которых пользователь ещё не был подписан.
+        """
+        created = insert_ignore_many(
+            self.model,
+            [
+                {'user': user, 'author_id': author_id}
+                for author_id in author_ids
+            ],
+            'author_id',
+        )
+        User.objects.filter(pk__in=created).update(
+            followers_count=F('followers_count') + 1,
+        )
+        return created
+
+    @transaction.atomic
+    def remove_many(self, user, author_ids):
+        removed = delete_returning(
+            self.model,
+            'author_id',
+            user=user,
+            author_id=list(author_ids),
+        )
+        User.objects.filter(pk__in=removed).update(
+            followers_count=F('followers_count') - 1,
+        )
+        return removed
+
+
 class Follow(models.Model):
     """
     Модель подписок.
@@ -54,10 +146,14 @@ class Follow(models.Model):
         verbose_name='Автор'
     )
 
+    objects = FollowManager()
+
     class Meta:
-        models.UniqueConstraint(
-            fields=('user', 'author'),
-            name='unique follow',
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique follow',
+            ),
         )
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'